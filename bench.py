@@ -0,0 +1,391 @@
+"""
+Benchmarks for the call-event pipeline, run entirely against local fakes.
+
+    python bench.py synthetic --calls 500 --concurrency 50 --mode pipeline
+    python bench.py replay frames.jsonl --speed 10 --mode socket
+    python bench.py synthetic --mode socket-async   # SCRAPER_ENGINE=async
+    python bench.py synthetic --mode handler        # on_call_event only
+    python bench.py startup                          # import time + first socket
+
+Modes:
+    handler   on_call_event alone, dispatch stubbed out (pure CPU cost)
+    pipeline  frames -> CallEventQueue -> handler -> job queue -> download
+              from the fake recording endpoint -> delivery scheduler ->
+              fake Bot API
+    socket    same as pipeline, but frames arrive over a local Socket.IO
+              server and the real run_scraper_loop() does the rest
+    socket-async
+              same as socket, with run_async_scraper_loop() (the async
+              engine) instead, so the two engines can be compared
+
+Reports events/sec, detect->notify and end->upload latency percentiles,
+and peak RSS.
+
+`startup` launches a fresh interpreter (python -X importtime) that imports
+main and starts run_scraper_loop() against the fake Socket.IO server, and
+reports import time, the slowest imports and time-to-first-connected-socket.
+
+Per-frame decode + call-state cost on its own: bench_frames.py.
+"""
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+import threading
+import concurrent.futures
+
+import main
+import log_setup
+from replay import load_frames, synthetic_frames, replay
+from event_queue import CallEventQueue
+from delivery import DeliveryScheduler
+from download_client import DownloadClient
+from job_store import DownloadJobQueue
+
+MASKED_RE = re.compile(r"\d+\*{3,4}\d+")
+TITLE_RE = re.compile(r"^rec_(.+)_\d+\.\w+$")
+
+
+def percentiles(values, points=(50, 95, 99)):
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    return {
+        f"p{p}": round(ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))] * 1000, 2)
+        for p in points
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+def iter_calls(frame):
+    calls_data = (frame or {}).get("calls", {}) or {}
+    for page in calls_data.get("calls", []) or []:
+        for call in (page.values() if isinstance(page, dict) else page):
+            if isinstance(call, dict):
+                yield call
+
+
+class LatencyTracker:
+    """Timestamps frames as they are fed and matches them to fake Bot API calls."""
+
+    def __init__(self):
+        self.frames = 0
+        self.call_entries = 0
+        self.uuid_did = {}
+        self.detected_at = {}   # masked number -> fed at
+        self.ended_at = {}      # did -> fed at
+
+    def on_frame(self, frame):
+        now = time.monotonic()
+        self.frames += 1
+        for call in iter_calls(frame):
+            self.call_entries += 1
+            uuid, did = call.get("uuid"), call.get("cid_num")
+            if uuid and did:
+                self.uuid_did.setdefault(uuid, did)
+            if call.get("status") == "up" and did:
+                self.detected_at.setdefault(main.mask_number(did), now)
+        for call_data in ((frame or {}).get("calls", {}) or {}).get("end", []) or []:
+            did = self.uuid_did.get(call_data.get("uuid"))
+            if did and main.mask_number(did) in self.detected_at:
+                self.ended_at.setdefault(did, now)
+
+    def expected_uploads(self):
+        return len(self.ended_at)
+
+    def latencies(self, telegram_events):
+        notify, upload = {}, {}
+        for (at, method, fields) in telegram_events:
+            if method == "sendMessage":
+                for masked in MASKED_RE.findall(fields.get("text", "")):
+                    notify.setdefault(masked, at)
+            elif method == "sendAudio":
+                m = TITLE_RE.match(fields.get("title", ""))
+                if m:
+                    upload.setdefault(m.group(1), at)
+        detect_to_notify = [notify[k] - t for k, t in self.detected_at.items() if k in notify]
+        end_to_upload = [upload[k] - t for k, t in self.ended_at.items() if k in upload]
+        return detect_to_notify, end_to_upload
+
+
+def uploads_seen(services):
+    return sum(1 for (_, method, _) in services.telegram_events if method == "sendAudio")
+
+
+def wait_for_delivery(services, tracker, timeout):
+    """Until every ended call was uploaded and every detected call notified (batches included)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if uploads_seen(services) >= tracker.expected_uploads():
+            detect_to_notify, _ = tracker.latencies(services.telegram_events)
+            if len(detect_to_notify) >= len(tracker.detected_at):
+                return
+        time.sleep(0.05)
+
+
+def point_main_at(services, args):
+    main.BASE_URL = services.base_url
+    main.TELEGRAM_API_URL = services.base_url
+    main.SOCKET_URL = services.socket_url
+    main.NOTIFY_BATCH_WINDOW_MS = args.batch_window_ms
+    main.delivery = DeliveryScheduler(
+        rate_per_minute=args.telegram_rate,
+        burst=max(3, args.telegram_rate // 60),
+        workers=main.DELIVERY_WORKERS,
+        max_attempts=main.DELIVERY_MAX_ATTEMPTS,
+        max_queue=main.DELIVERY_MAX_QUEUED_MESSAGES,
+        max_audio_queue=main.DELIVERY_MAX_QUEUED_AUDIO
+    )
+
+
+# ==========================================================
+# === MODES
+# ==========================================================
+
+class NullDispatchHandler(main.CallHandler):
+    def __init__(self):
+        super().__init__(None, None)
+        self.batcher = None
+        self.notifications = 0
+        self.downloads = 0
+
+    def submit_notification(self, text_message):
+        self.notifications += 1
+
+    def submit_download(self, uuid, download_url, did, last_duration, country):
+        self.downloads += 1
+
+
+def run_handler_mode(frames, args):
+    frames = [frame for (_, frame) in frames]
+    tracker = LatencyTracker()
+    for frame in frames:
+        tracker.on_frame(frame)
+
+    handler = NullDispatchHandler()
+    started = time.perf_counter()
+    for frame in frames:
+        handler.on_call_event(frame)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "mode": "handler",
+        "frames": len(frames),
+        "frames_per_sec": round(len(frames) / elapsed, 1) if elapsed else None,
+        "call_entries_per_sec": round(tracker.call_entries / elapsed, 1) if elapsed else None,
+        "us_per_frame": round(elapsed / max(1, len(frames)) * 1e6, 2),
+        "notifications": handler.notifications,
+        "downloads": handler.downloads,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_pipeline_mode(frames, args, services, workdir):
+    point_main_at(services, args)
+
+    http_session = main.build_http_session("bench=1")
+    client = DownloadClient.from_session(http_session, pool_maxsize=main.DOWNLOAD_POOL_SIZE)
+    main.current_download_client = client
+
+    jobs = DownloadJobQueue(
+        os.path.join(workdir, "jobs.db"),
+        process=main.run_download_job,
+        workers=main.JOB_WORKERS,
+        max_attempts=main.JOB_MAX_ATTEMPTS
+    )
+    jobs.start()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+    handler = main.CallHandler(client, executor, jobs=jobs)
+    event_queue = CallEventQueue(handler.on_call_event, maxsize=main.EVENT_QUEUE_MAXSIZE)
+    event_queue.start()
+
+    tracker = LatencyTracker()
+    count, feed_elapsed = replay(frames, event_queue.put, speed=args.speed, on_frame=tracker.on_frame)
+    event_queue.stop()
+    wait_for_delivery(services, tracker, args.timeout)
+
+    return report("pipeline", tracker, services, count, feed_elapsed, {
+        "event_queue": event_queue.stats(),
+        "download_pool": client.pool_stats(),
+        "delivery": main.delivery.stats(),
+        "jobs": jobs.stats(),
+    })
+
+
+def run_async_engine():
+    asyncio.run(main.run_async_scraper_loop())
+
+
+def run_socket_mode(frames, args, services, workdir):
+    point_main_at(services, args)
+    with open(main.CREDS_FILE, "w") as f:
+        json.dump({"MANUAL_COOKIE_STRING": "bench=1"}, f)
+
+    engine = run_async_engine if args.mode == "socket-async" else main.run_scraper_loop
+    started = time.monotonic()
+    threading.Thread(target=engine, daemon=True).start()
+    if not services.connected.wait(args.timeout):
+        raise SystemExit("scraper never connected to the fake Socket.IO server")
+    time_to_connect = services.connected_at - started
+
+    tracker = LatencyTracker()
+    count, feed_elapsed = replay(frames, services.emit_frame, speed=args.speed, on_frame=tracker.on_frame)
+    wait_for_delivery(services, tracker, args.timeout)
+
+    return report(args.mode, tracker, services, count, feed_elapsed, {
+        "time_to_first_connected_socket_ms": round(time_to_connect * 1000, 1),
+        "delivery": main.delivery.stats(),
+    })
+
+
+STARTUP_CHILD = """
+import sys, time, json, threading
+started = time.monotonic()
+import main
+imported = time.monotonic()
+main.BASE_URL = main.TELEGRAM_API_URL = sys.argv[1]
+main.SOCKET_URL = sys.argv[2]
+print(json.dumps({"started": started, "imported": imported}), flush=True)
+threading.Thread(target=main.run_scraper_loop, daemon=True).start()
+time.sleep(float(sys.argv[3]))
+"""
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def slowest_imports(importtime_output, top=10):
+    """Top-level modules by cumulative import time from `-X importtime` output."""
+    cumulative = {}
+    for line in importtime_output.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if m and len(m.group(3)) <= 1:
+            cumulative[m.group(4)] = int(m.group(2))
+    ranked = sorted(cumulative.items(), key=lambda kv: -kv[1])[:top]
+    return {name: round(us / 1000, 1) for name, us in ranked}
+
+
+def run_startup_mode(args, services, workdir):
+    with open(os.path.join(workdir, "creds.json"), "w") as f:
+        json.dump({"MANUAL_COOKIE_STRING": "bench=1"}, f)
+
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(main.__file__)), LOG_LEVEL="WARNING")
+    spawned = time.monotonic()
+    child = subprocess.Popen(
+        [sys.executable, "-X", "importtime", "-c", STARTUP_CHILD,
+         services.base_url, services.socket_url, str(args.timeout)],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    )
+    try:
+        timing = json.loads(child.stdout.readline() or "{}")
+        connected = services.connected.wait(args.timeout)
+    finally:
+        child.kill()
+        _, importtime_output = child.communicate()
+
+    if not timing:
+        raise SystemExit("startup child failed:\n" + importtime_output[-2000:])
+    return {
+        "mode": "startup",
+        "interpreter_start_ms": round((timing["started"] - spawned) * 1000, 1),
+        "import_main_ms": round((timing["imported"] - timing["started"]) * 1000, 1),
+        "time_to_first_connected_socket_ms":
+            round((services.connected_at - spawned) * 1000, 1) if connected else None,
+        "slowest_imports_ms": slowest_imports(importtime_output),
+    }
+
+
+def report(mode, tracker, services, count, feed_elapsed, extra):
+    detect_to_notify, end_to_upload = tracker.latencies(services.telegram_events)
+    result = {
+        "mode": mode,
+        "frames": count,
+        "frames_per_sec": round(count / feed_elapsed, 1) if feed_elapsed else None,
+        "call_entries_per_sec": round(tracker.call_entries / feed_elapsed, 1) if feed_elapsed else None,
+        "detected": len(tracker.detected_at),
+        "notified": len(detect_to_notify),
+        "expected_uploads": tracker.expected_uploads(),
+        "uploaded": len(end_to_upload),
+        "recordings_served": services.recordings_served,
+        "detect_to_notify_ms": percentiles(detect_to_notify),
+        "end_to_upload_ms": percentiles(end_to_upload),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(extra)
+    return result
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="source", required=True)
+
+    syn = sub.add_parser("synthetic", help="generated call traffic")
+    syn.add_argument("--calls", type=int, default=300)
+    syn.add_argument("--concurrency", type=int, default=30)
+    syn.add_argument("--frame-interval", type=float, default=0.2)
+
+    rep = sub.add_parser("replay", help="frames captured with CAPTURE_FRAMES_FILE")
+    rep.add_argument("capture_file")
+
+    start = sub.add_parser("startup", help="import time and time-to-first-connected-socket")
+    start.add_argument("--timeout", type=float, default=60)
+
+    for p in (syn, rep):
+        p.add_argument("--mode", choices=["handler", "pipeline", "socket", "socket-async"], default="pipeline")
+        p.add_argument("--speed", type=float, default=0, help="1 = real time, 10 = 10x, 0 = max (default)")
+        p.add_argument("--recording-kb", type=int, default=64)
+        p.add_argument("--telegram-latency", type=float, default=0.0, help="seconds added by the fake Bot API")
+        p.add_argument("--telegram-rate", type=int, default=6000, help="delivery token bucket, messages/minute")
+        p.add_argument("--batch-window-ms", type=int, default=main.NOTIFY_BATCH_WINDOW_MS)
+        p.add_argument("--timeout", type=float, default=60)
+
+    args = parser.parse_args()
+    # Keep stdout for the JSON report; scraper logs go to stderr.
+    log_setup.setup_logging(level=os.environ.get("LOG_LEVEL", "WARNING"), stream=sys.stderr)
+
+    if args.source == "startup":
+        frames, args.mode = None, "startup"
+    elif args.source == "synthetic":
+        frames = list(synthetic_frames(args.calls, args.concurrency, frame_interval=args.frame_interval))
+    else:
+        frames = list(load_frames(args.capture_file))
+
+    if args.mode == "handler":
+        result = run_handler_mode(frames, args)
+    else:
+        from bench_fakes import FakeServices
+        services = FakeServices(
+            recording_bytes=getattr(args, "recording_kb", 64) * 1024,
+            telegram_latency=getattr(args, "telegram_latency", 0.0)
+        ).start()
+        workdir = tempfile.mkdtemp(prefix="bench_")
+        os.chdir(workdir)
+        try:
+            if args.mode == "startup":
+                result = run_startup_mode(args, services, workdir)
+            elif args.mode == "pipeline":
+                result = run_pipeline_mode(frames, args, services, workdir)
+            else:
+                result = run_socket_mode(frames, args, services, workdir)
+            # Report before shutting the fakes down: the scraper's socket
+            # is still open at this point.
+            print(json.dumps(result, indent=2), flush=True)
+        finally:
+            services.stop()
+        return
+
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,140 @@
+import sys
+import time
+import socket
+import asyncio
+import threading
+from urllib.parse import urlencode, parse_qsl
+
+import socketio
+from aiohttp import web
+
+# ==========================================================
+# === LOCAL STAND-INS FOR BENCHMARKS
+# ==========================================================
+# One aiohttp app on 127.0.0.1 that plays all three remote parties:
+#   - a Socket.IO server that emits `call` frames to the scraper,
+#   - the recording endpoint  GET  /live/calls/sound?did=..&uuid=..
+#   - the Telegram Bot API    POST /bot<token>/<method>
+# It runs on its own event loop in a background thread and records when
+# each Bot API request arrived, so benchmarks can measure latencies.
+
+
+@web.middleware
+async def _single_eio_param(request, handler):
+    # main.py puts EIO=3 in the socket URL and the client appends its own
+    # EIO; keep only the last one so the local server accepts it.
+    pairs = parse_qsl(request.query_string, keep_blank_values=True)
+    eio = [v for (k, v) in pairs if k == "EIO"]
+    if len(eio) > 1:
+        pairs = [(k, v) for (k, v) in pairs if k != "EIO"] + [("EIO", eio[-1])]
+        request = request.clone(rel_url=request.rel_url.with_query(urlencode(pairs)))
+    return await handler(request)
+
+
+class FakeServices:
+    def __init__(self, recording_bytes=64 * 1024, recording_latency=0.0, telegram_latency=0.0):
+        self.recording = b"\xff\xfb\x90\x00" * (recording_bytes // 4 - 16)
+        self.recording_latency = recording_latency
+        self.telegram_latency = telegram_latency
+
+        self.telegram_events = []   # (monotonic, method, fields)
+        self.recordings_served = 0
+        self.connected = threading.Event()
+        self.connected_at = None
+        self.sids = set()
+
+        self.loop = None
+        self.port = None
+        self._runner = None
+        self._ready = threading.Event()
+
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application(middlewares=[_single_eio_param], client_max_size=64 * 1024 * 1024)
+        self.sio.attach(self.app)
+        self.app.router.add_get("/live/calls/sound", self._sound)
+        self.app.router.add_post("/{bot}/{method}", self._telegram)
+
+        @self.sio.event
+        async def connect(sid, environ):
+            if self.connected_at is None:
+                self.connected_at = time.monotonic()
+            self.sids.add(sid)
+            self.connected.set()
+
+        @self.sio.event
+        async def disconnect(sid):
+            self.sids.discard(sid)
+
+    # --- URLs to point main.py at ---
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def socket_url(self):
+        return f"ws://127.0.0.1:{self.port}"
+
+    # --- Handlers ---
+    async def _sound(self, request):
+        if self.recording_latency:
+            await asyncio.sleep(self.recording_latency)
+        self.recordings_served += 1
+        # Unique bytes per call, like real recordings (the scraper skips
+        # identical content for the same number).
+        tag = request.query.get("uuid", "").encode().ljust(64, b"\0")[:64]
+        return web.Response(body=self.recording + tag, content_type="audio/mpeg")
+
+    async def _telegram(self, request):
+        method = request.match_info["method"]
+        form = await request.post()
+        fields = {k: v for k, v in form.items() if isinstance(v, str)}
+        if self.telegram_latency:
+            await asyncio.sleep(self.telegram_latency)
+        self.telegram_events.append((time.monotonic(), method, fields))
+
+        result = {"message_id": len(self.telegram_events), "chat": {"id": fields.get("chat_id")}}
+        if method == "sendAudio":
+            result["audio"] = {"file_id": f"audio-{len(self.telegram_events)}"}
+        return web.json_response({"ok": True, "result": result})
+
+    # --- Lifecycle ---
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+
+        self._runner = web.AppRunner(self.app)
+        self.loop.run_until_complete(self._runner.setup())
+        self.loop.run_until_complete(web.SockSite(self._runner, sock).start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        threading.Thread(target=self._run, name="bench-fakes", daemon=True).start()
+        self._ready.wait(10)
+        return self
+
+    async def _shutdown(self):
+        # Stop listening first so the scraper cannot reconnect, then close
+        # its socket: cleanup() waits for every open websocket handler.
+        for site in list(self._runner.sites):
+            await site.stop()
+        for sid in list(self.sids):
+            await self.sio.disconnect(sid)
+        await self._runner.cleanup()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(10)
+        except Exception as e:
+            print(f"fake services did not shut down cleanly: {e!r}", file=sys.stderr)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def emit_frame(self, frame):
+        """Sends one `call` frame to every connected client (blocking)."""
+        asyncio.run_coroutine_threadsafe(self.sio.emit("call", frame), self.loop).result(10)
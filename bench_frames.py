@@ -0,0 +1,181 @@
+"""
+Microbenchmark for the socket thread's per-frame work: decoding the
+Socket.IO `call` packet and applying it to the call state.
+
+    python bench_frames.py                          # synthetic frames
+    python bench_frames.py --capture frames.jsonl   # captured frames
+    python bench_frames.py --calls 2000 --concurrency 300 --pages 4
+
+Frames are re-encoded as the wire payload (["call", frame]) once, then
+timed on:
+    decode  json loads of each payload
+    apply   decode + applying the frame to a fresh call state
+
+The baseline row is the path before frame_codec: stdlib json and a
+per-call .get()/int() walk of the page dicts (DictWalkStore below, a
+copy of the old CallStateStore loop). Every installed decoder is then
+timed on the current path, frame_codec.extract_frame +
+CallStateStore.apply_rows; speedup is against the baseline. Imports
+neither main nor any network dependency.
+"""
+import sys
+import json
+import time
+import argparse
+
+import frame_codec
+from call_state import CallStateStore, CallRecord, Transition, NEW, UP, UPDATED, ENDED, parse_duration
+from replay import load_frames, synthetic_frames
+
+DECODERS = ("stdlib",) + frame_codec.FAST_DECODERS
+BASELINE = "stdlib, dict walk (baseline)"
+
+
+class DictWalkStore(CallStateStore):
+    """CallStateStore with the pre-frame_codec frame loop, as the baseline."""
+
+    def apply_dicts(self, page_list, ended_calls_list):
+        out = self._start_frame()
+        for call_list_on_page in page_list or []:
+            if isinstance(call_list_on_page, dict):
+                call_iterable = call_list_on_page.values()
+            else:
+                call_iterable = call_list_on_page
+            for call in call_iterable:
+                self._observe_dict(call, out)
+
+        for call_data in ended_calls_list or []:
+            uuid = call_data.get('uuid')
+            if uuid not in self.records:
+                continue
+            record = self._remove(uuid)
+            if 'duration' in call_data:
+                record.raw_duration = call_data.get('duration')
+                record.duration = parse_duration(record.raw_duration)
+            out.append(Transition(ENDED, uuid, record))
+        return self._end_frame((), out)
+
+    def _observe_dict(self, call, out):
+        uuid = call.get('uuid')
+        if not uuid:
+            return
+        status = call.get('status')
+        raw_duration = call.get('duration', '0')
+        generation = self.generation
+
+        record = self.records.get(uuid)
+        if record is None:
+            record = CallRecord(uuid, status, raw_duration, call.get('cid_num', 'Unknown'),
+                                call.get('termination', 'UNKNOWN'), generation, self._now)
+            self.records[uuid] = record
+            self._seen_this_generation += 1
+            out.append(Transition(NEW, uuid, record))
+            if status == 'up':
+                record.detected = True
+                self.detected_count += 1
+                out.append(Transition(UP, uuid, record))
+            return
+
+        if record.last_seen != generation:
+            record.last_seen = generation
+            record.seen_at = self._now
+            self.records.move_to_end(uuid)
+            self._seen_this_generation += 1
+
+        changed = False
+        if status != record.status:
+            record.status = status
+            changed = True
+            if status == 'up' and not record.detected:
+                record.detected = True
+                self.detected_count += 1
+                record.did = call.get('cid_num', 'Unknown')
+                record.termination = call.get('termination', 'UNKNOWN')
+                out.append(Transition(UP, uuid, record))
+                changed = False
+        if raw_duration != record.raw_duration:
+            record.raw_duration = raw_duration
+            record.duration = parse_duration(raw_duration)
+            changed = True
+        if changed:
+            out.append(Transition(UPDATED, uuid, record))
+
+
+def wire_payloads(frames):
+    return [json.dumps(["call", frame], separators=(",", ":")) for _, frame in frames]
+
+
+def time_decode(loads, payloads):
+    started = time.perf_counter()
+    for payload in payloads:
+        loads(payload)
+    return time.perf_counter() - started
+
+
+def time_apply(loads, payloads):
+    state = CallStateStore()
+    extract_frame = frame_codec.extract_frame
+    started = time.perf_counter()
+    for payload in payloads:
+        rows, ended = extract_frame(loads(payload)[1])
+        state.apply_rows(rows, ended)
+    return time.perf_counter() - started
+
+
+def time_apply_baseline(loads, payloads):
+    state = DictWalkStore()
+    started = time.perf_counter()
+    for payload in payloads:
+        calls_data = loads(payload)[1].get('calls', {})
+        state.apply_dicts(calls_data.get('calls', []), calls_data.get('end', []))
+    return time.perf_counter() - started
+
+
+def best_of_interleaved(runs, repeat):
+    """{name: (min decode, min apply)}; repeats are interleaved so drift hits every path alike."""
+    best = {name: [float("inf"), float("inf")] for name in runs}
+    for _ in range(repeat):
+        for name, (decode, apply) in runs.items():
+            best[name][0] = min(best[name][0], decode())
+            best[name][1] = min(best[name][1], apply())
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capture", help="JSONL capture file (default: synthetic frames)")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    args = parser.parse_args(argv)
+
+    if args.capture:
+        frames = list(load_frames(args.capture))
+    else:
+        frames = list(synthetic_frames(calls=args.calls, concurrency=args.concurrency, pages=args.pages))
+    payloads = wire_payloads(frames)
+    total_bytes = sum(len(p) for p in payloads)
+    print(f"{len(payloads)} frames, {total_bytes / len(payloads) / 1024:.1f} KiB avg")
+
+    runs = {BASELINE: (lambda: time_decode(json.loads, payloads),
+                       lambda: time_apply_baseline(json.loads, payloads))}
+    for name in DECODERS:
+        decoder = frame_codec.load_decoder(name)
+        if decoder.name != name:
+            print(f"  {name:8} not installed")
+            continue
+        runs[f"{name}, rows"] = (lambda loads=decoder.loads: time_decode(loads, payloads),
+                                 lambda loads=decoder.loads: time_apply(loads, payloads))
+    results = best_of_interleaved(runs, args.repeat)
+
+    _, base_apply = results[BASELINE]
+    print(f"  {'path':30} {'decode us/frame':>16} {'apply us/frame':>16} {'frames/s':>10} {'speedup':>8}")
+    for name, (decode, apply) in results.items():
+        print(f"  {name:30} {decode / len(payloads) * 1e6:16.1f} {apply / len(payloads) * 1e6:16.1f} "
+              f"{len(payloads) / apply:10.0f} {base_apply / apply:7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import time
+from collections import namedtuple, OrderedDict
+from frame_codec import extract_rows, extract_ended
+
+# ==========================================================
+# === INCREMENTAL CALL STATE STORE
+# ==========================================================
+# Keeps one record per call UUID and turns each `call` frame into a list
+# of typed transitions, emitted only for UUIDs whose state changed.
+# Stale pruning uses a generation counter: every frame bumps the
+# generation and stamps the UUIDs it contains, so when every tracked UUID
+# was seen this frame the stale sweep is skipped entirely.
+#
+# Memory is bounded independently of the feed behaving: records are kept
+# in least-recently-seen order, anything not seen for `ttl` seconds is
+# expired, and above `max_records` the least recently seen are evicted.
+# Both show up as EVICTED transitions and in stats().
+#
+# Frames are applied as the flat row tuples built by frame_codec
+# (apply_rows); apply_frame() takes the raw page/end lists instead.
+
+NEW = "new"          # First time this UUID shows up (any status)
+UP = "up"            # Call went 'up' -> "NEW CALL DETECTED"
+UPDATED = "updated"  # Status or duration changed on a known call
+ENDED = "ended"      # Listed in the frame's `end` list
+STALE = "stale"      # Vanished from the page without an `end` event
+EVICTED = "evicted"  # Dropped by the TTL or the size cap
+
+Transition = namedtuple("Transition", ["kind", "uuid", "record"])
+
+
+def parse_duration(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class CallRecord:
+    """Per-UUID state."""
+
+    __slots__ = ("uuid", "status", "raw_duration", "duration", "did", "termination",
+                 "first_seen", "last_seen", "seen_at", "detected", "country", "flag")
+
+    def __init__(self, uuid, status, raw_duration, did, termination, generation, now):
+        self.uuid = uuid
+        self.status = status
+        self.raw_duration = raw_duration
+        self.duration = parse_duration(raw_duration)
+        self.did = did
+        self.termination = termination
+        self.first_seen = generation
+        self.last_seen = generation
+        self.seen_at = now
+        self.detected = False
+        # Filled in by the handler once the call is detected.
+        self.country = None
+        self.flag = None
+
+
+class CallStateStore:
+    def __init__(self, max_records=10000, ttl=6 * 3600, clock=time.monotonic):
+        self.records = OrderedDict()   # least recently seen first
+        self.max_records = max_records
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = 0
+        self.detected_count = 0
+        self.expired = 0
+        self.evicted = 0
+        self._seen_this_generation = 0
+        self._now = 0.0
+        self._next_expiry = 0.0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, uuid):
+        return uuid in self.records
+
+    def get(self, uuid):
+        return self.records.get(uuid)
+
+    def _remove(self, uuid):
+        record = self.records.pop(uuid, None)
+        if record is not None:
+            if record.last_seen == self.generation:
+                self._seen_this_generation -= 1
+            if record.detected:
+                self.detected_count -= 1
+        return record
+
+    def _observe(self, row, out):
+        uuid, status, raw_duration, did, termination = row
+        if not uuid:
+            return
+        generation = self.generation
+
+        record = self.records.get(uuid)
+        if record is None:
+            record = CallRecord(uuid, status, raw_duration, did, termination, generation, self._now)
+            self.records[uuid] = record
+            self._seen_this_generation += 1
+            out.append(Transition(NEW, uuid, record))
+            if status == 'up':
+                record.detected = True
+                self.detected_count += 1
+                out.append(Transition(UP, uuid, record))
+            return
+
+        if record.last_seen != generation:
+            record.last_seen = generation
+            record.seen_at = self._now
+            self.records.move_to_end(uuid)
+            self._seen_this_generation += 1
+
+        changed = False
+        if status != record.status:
+            record.status = status
+            changed = True
+            if status == 'up' and not record.detected:
+                record.detected = True
+                self.detected_count += 1
+                record.did = did
+                record.termination = termination
+                out.append(Transition(UP, uuid, record))
+                changed = False
+        if raw_duration != record.raw_duration:
+            record.raw_duration = raw_duration
+            record.duration = parse_duration(raw_duration)
+            changed = True
+        if changed:
+            out.append(Transition(UPDATED, uuid, record))
+
+    def apply_frame(self, page_list, ended_calls_list):
+        """Applies one `call` frame and returns the resulting transitions."""
+        return self.apply_rows(extract_rows(page_list), extract_ended(ended_calls_list))
+
+    def apply_rows(self, rows, ended):
+        """Same as apply_frame, for rows/ended already extracted by frame_codec."""
+        out = self._start_frame()
+        records = self.records
+        generation = self.generation
+        now = self._now
+        observe = self._observe
+        seen = 0
+        for row in rows:
+            record = records.get(row[0])
+            # Fast path, most rows of a busy feed: a tracked call, first
+            # sighting this frame, status unchanged (duration ticking).
+            if record is not None and record.last_seen != generation and row[1] == record.status:
+                record.last_seen = generation
+                record.seen_at = now
+                records.move_to_end(row[0])
+                seen += 1
+                if row[2] != record.raw_duration:
+                    record.raw_duration = row[2]
+                    record.duration = parse_duration(row[2])
+                    out.append(Transition(UPDATED, row[0], record))
+                continue
+            observe(row, out)
+        self._seen_this_generation += seen
+        return self._end_frame(ended, out)
+
+    def _start_frame(self):
+        self.generation += 1
+        self._seen_this_generation = 0
+        self._now = self.clock()
+        return []
+
+    def _end_frame(self, ended, out):
+        """Ended calls, stale sweep, TTL expiry and the size cap."""
+        for uuid, raw_duration in ended:
+            if uuid not in self.records:
+                continue
+            record = self._remove(uuid)
+            if raw_duration is not None:
+                record.raw_duration = raw_duration
+                record.duration = parse_duration(raw_duration)
+            out.append(Transition(ENDED, uuid, record))
+
+        # Every tracked UUID was stamped this generation -> nothing is stale.
+        if self._seen_this_generation < len(self.records):
+            generation = self.generation
+            stale = [uuid for uuid, record in self.records.items() if record.last_seen != generation]
+            for uuid in stale:
+                out.append(Transition(STALE, uuid, self._remove(uuid)))
+
+        self._expire(out)
+        while len(self.records) > self.max_records:
+            uuid = next(iter(self.records))
+            self.evicted += 1
+            out.append(Transition(EVICTED, uuid, self._remove(uuid)))
+
+        return out
+
+    def _expire(self, out):
+        """Drops records not seen for `ttl` seconds (checked at most every ttl/10)."""
+        now = self._now
+        if now < self._next_expiry:
+            return
+        self._next_expiry = now + self.ttl / 10
+        cutoff = now - self.ttl
+        while self.records:
+            uuid, record = next(iter(self.records.items()))
+            if record.seen_at > cutoff:
+                break
+            self.expired += 1
+            out.append(Transition(EVICTED, uuid, self._remove(uuid)))
+
+    def stats(self):
+        return {
+            "tracked": len(self.records),
+            "detected": self.detected_count,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
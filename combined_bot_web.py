@@ -0,0 +1,24 @@
+from flask import Flask, Response
+
+from metrics import registry
+
+# ==========================================================
+# === WEB PROCESS: METRICS + HEALTH
+# ==========================================================
+# main.py serves this app on $PORT (default 8080) from a background
+# thread of the bot process (see start_metrics_server), which is the only
+# place the registry has data; the Procfile's web process is main.py.
+# Don't run this module on its own (e.g. under gunicorn): it would only
+# expose that process's own, empty registry.
+
+app = Flask(__name__)
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz")
+def healthz():
+    return {"ok": True}
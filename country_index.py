@@ -0,0 +1,219 @@
+import re
+import threading
+from collections import OrderedDict
+
+# ==========================================================
+# === COUNTRY / FLAG RESOLUTION INDEX
+# ==========================================================
+# The index is built from pycountry once (on first use) and every
+# termination string that has been resolved is remembered in a small LRU,
+# so the socket thread never runs pycountry's fuzzy search more than once
+# per distinct termination.
+
+DEFAULT_FLAG = "🌍"
+UNKNOWN_COUNTRY = "UNKNOWN"
+
+# Names the carrier uses that pycountry does not know verbatim.
+COUNTRY_ALIASES = {
+    "USA": "US",
+    "US": "US",
+    "UNITED STATES OF AMERICA": "US",
+    "AMERICA": "US",
+    "UK": "GB",
+    "ENGLAND": "GB",
+    "GREAT BRITAIN": "GB",
+    "BRITAIN": "GB",
+    "RUSSIA": "RU",
+    "KOREA": "KR",
+    "SOUTH KOREA": "KR",
+    "NORTH KOREA": "KP",
+    "IRAN": "IR",
+    "SYRIA": "SY",
+    "LAOS": "LA",
+    "VIETNAM": "VN",
+    "BOLIVIA": "BO",
+    "VENEZUELA": "VE",
+    "TANZANIA": "TZ",
+    "MOLDOVA": "MD",
+    "TAIWAN": "TW",
+    "MACEDONIA": "MK",
+    "PALESTINE": "PS",
+    "IVORY COAST": "CI",
+    "COTE DIVOIRE": "CI",
+    "CONGO DR": "CD",
+    "DR CONGO": "CD",
+    "DRC": "CD",
+    "CONGO": "CG",
+    "CZECH REPUBLIC": "CZ",
+    "UAE": "AE",
+    "EMIRATES": "AE",
+    "CAPE VERDE": "CV",
+    "SWAZILAND": "SZ",
+    "BURMA": "MM",
+    "TURKEY": "TR",
+    "MICRONESIA": "FM",
+    "VATICAN": "VA",
+    "KOSOVO": "XK",
+}
+
+_NON_ALNUM = re.compile(r"[^A-Z0-9 ]+")
+
+
+def normalize_name(name):
+    """Upper-cases a name and strips punctuation/extra spaces."""
+    return " ".join(_NON_ALNUM.sub("", str(name).upper().replace("-", " ")).split())
+
+
+def flag_from_alpha_2(code):
+    """Turns an ISO alpha-2 code into a flag emoji."""
+    if not code or len(code) != 2 or not code.isalpha():
+        return DEFAULT_FLAG
+    return "".join(chr(0x1F1E6 + ord(char) - ord('A')) for char in code.upper())
+
+
+def country_name_from_termination(termination_string):
+    """Extracts the country name from a termination string."""
+    try:
+        parts = str(termination_string).split()
+        country_parts = []
+        for part in parts:
+            if part.lower() == 'mobile' or part.isdigit():
+                break
+            country_parts.append(part.upper())
+
+        country = ' '.join(country_parts)
+        return country if country else UNKNOWN_COUNTRY
+    except:
+        return UNKNOWN_COUNTRY
+
+
+class _LRU:
+    """Tiny thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CountryIndex:
+    """Resolves termination strings / country names to (name, alpha_2, flag)."""
+
+    def __init__(self, cache_size=2048):
+        self._index = None
+        self._build_lock = threading.Lock()
+        self._cache = _LRU(cache_size)
+        self.index_hits = 0
+        self.fuzzy_lookups = 0
+
+    def _build(self):
+        import pycountry
+
+        index = {}
+        for country in pycountry.countries:
+            code = country.alpha_2
+            for attr in ("name", "official_name", "common_name"):
+                value = getattr(country, attr, None)
+                if not value:
+                    continue
+                index.setdefault(normalize_name(value), code)
+                # "Iran, Islamic Republic of" -> also "IRAN"
+                if "," in value:
+                    index.setdefault(normalize_name(value.split(",")[0]), code)
+            index.setdefault(country.alpha_3, code)
+        # Aliases win over anything pycountry produced.
+        for alias, code in COUNTRY_ALIASES.items():
+            index[normalize_name(alias)] = code
+        return index
+
+    def _ensure_index(self):
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    self._index = self._build()
+        return self._index
+
+    def _lookup_code(self, country_name):
+        index = self._ensure_index()
+        words = normalize_name(country_name).split()
+        # Longest word prefix first: "UNITED STATES FIXED" -> "UNITED STATES".
+        for end in range(len(words), 0, -1):
+            code = index.get(" ".join(words[:end]))
+            if code:
+                self.index_hits += 1
+                return code
+
+        # Last resort, paid once per distinct name thanks to the LRU.
+        self.fuzzy_lookups += 1
+        try:
+            import pycountry
+            return pycountry.countries.search_fuzzy(country_name)[0].alpha_2
+        except:
+            return None
+
+    def lookup(self, country_name):
+        """Returns (alpha_2 or None, flag) for a country name."""
+        key = ("name", country_name)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        code = None
+        if country_name and country_name != UNKNOWN_COUNTRY:
+            code = self._lookup_code(country_name)
+        result = (code, flag_from_alpha_2(code))
+        self._cache.put(key, result)
+        return result
+
+    def resolve(self, termination_string):
+        """Returns (country_name, flag) for a raw termination string."""
+        key = ("termination", termination_string)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        country = country_name_from_termination(termination_string)
+        result = (country, self.lookup(country)[1])
+        self._cache.put(key, result)
+        return result
+
+    def flag_for(self, country_name):
+        """Returns the flag emoji for a country name."""
+        return self.lookup(country_name)[1]
+
+    def stats(self):
+        return {
+            "cache_hits": self._cache.hits,
+            "cache_misses": self._cache.misses,
+            "cache_size": len(self._cache),
+            "index_hits": self.index_hits,
+            "fuzzy_lookups": self.fuzzy_lookups,
+            "index_size": len(self._index) if self._index is not None else 0,
+        }
+
+
+# Shared instance used by the scraper and the audio sender.
+country_index = CountryIndex()
@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import namedtuple
+
+log = logging.getLogger("credentials")
+
+# ==========================================================
+# === CREDENTIAL PROVIDER (IN MEMORY + creds.json WATCHER)
+# ==========================================================
+# Single source of truth for token/user/cookie. The bot calls update()
+# with a new cookie; a watcher thread picks up edits made to creds.json
+# by hand or by another process. Either way every subscriber is told
+# (old, new) right away, so the scraper can swap the cookie into its live
+# download pool and only reconnect the socket when token/user changed.
+# Waiting for a missing creds.json is a condition wait, not a sleep loop.
+#
+# With `account` set, the file is a multi-account file (see shards.py):
+#   {"accounts": [{"name": "a1", "MANUAL_TOKEN": ..., "MANUAL_USER": ...,
+#                  "MANUAL_COOKIE_STRING": ...}, ...]}
+# and the provider follows the entry with that name.
+
+
+class Credentials(namedtuple("Credentials", "token user cookie")):
+    __slots__ = ()
+
+    @property
+    def socket_auth(self):
+        """What the Socket.IO connection is authenticated with."""
+        return (self.token, self.user)
+
+    def __repr__(self):
+        return f"Credentials(user={self.user}, cookie={len(self.cookie or '')} chars)"
+
+
+class CredentialProvider:
+    def __init__(self, path, default_token=None, default_user=None, poll_interval=2.0, account=None):
+        """
+        default_token / default_user are used when creds.json does not
+        carry MANUAL_TOKEN / MANUAL_USER of its own.
+        """
+        self.path = path
+        self.account = account
+        self.default_token = default_token
+        self.default_user = default_user
+        self.poll_interval = poll_interval
+
+        self.changes = 0
+        self.reloads = 0
+        self.errors = 0
+
+        self._current = None
+        self._signature = None
+        self._subscribers = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    # --- Reading ---
+    def current(self):
+        """Latest credentials, or None while there are none."""
+        if self._current is None and self._thread is None:
+            self.reload()
+        return self._current
+
+    def wait(self, timeout=None):
+        """Blocks until credentials exist (or timeout); returns them or None."""
+        self.start()
+        with self._cond:
+            if self._current is None:
+                log.warning("No usable `%s` yet. Send the /update command to the bot to create it.", self.path)
+            self._cond.wait_for(lambda: self._current is not None, timeout)
+            return self._current
+
+    def _file_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_file(self):
+        with open(self.path, "r") as f:
+            creds = json.load(f)
+        if self.account is not None:
+            creds = account_entry(creds, self.account)
+            if creds is None:
+                log.warning("`%s` has no account named %r.", self.path, self.account)
+                return None
+        cookie = creds.get("MANUAL_COOKIE_STRING")
+        if not cookie:
+            log.warning("`%s` is missing cookie. Please run /update on the bot again.", self.path)
+            return None
+        return Credentials(
+            creds.get("MANUAL_TOKEN") or self.default_token,
+            creds.get("MANUAL_USER") or self.default_user,
+            cookie
+        )
+
+    def reload(self):
+        """Re-reads creds.json if it changed on disk since the last look."""
+        signature = self._file_signature()
+        if signature == self._signature:
+            return self._current
+        self._signature = signature
+        if signature is None:
+            return self._current
+        self.reloads += 1
+        try:
+            creds = self._read_file()
+        except Exception as e:
+            self.errors += 1
+            log.error("Error reading `%s`: %s", self.path, e)
+            return self._current
+        if creds is not None:
+            self._publish(creds)
+        return self._current
+
+    # --- Writing ---
+    def update(self, cookie, token=None, user=None):
+        """
+        Sets new credentials in memory, notifies subscribers and persists
+        them to creds.json (write to a temp file, then rename). Returns
+        (old, new).
+        """
+        old = self._current
+        creds = Credentials(
+            token or (old.token if old else self.default_token),
+            user or (old.user if old else self.default_user),
+            cookie
+        )
+        entry = {
+            "MANUAL_TOKEN": creds.token,
+            "MANUAL_USER": creds.user,
+            "MANUAL_COOKIE_STRING": creds.cookie
+        }
+        if self.account is not None:
+            entry = self._merge_account(entry)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f, indent=4)
+        os.replace(tmp, self.path)
+        self._signature = self._file_signature()
+        self._publish(creds)
+        return old, creds
+
+    def _merge_account(self, entry):
+        """The whole multi-account file with this account's entry replaced."""
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {"accounts": []}
+        accounts = [a for a in data.get("accounts", []) if a.get("name") != self.account]
+        accounts.append({"name": self.account, **entry})
+        return {**data, "accounts": accounts}
+
+    def _publish(self, creds):
+        with self._cond:
+            old = self._current
+            if creds == old:
+                return
+            self._current = creds
+            self.changes += 1
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        log.info("Credentials changed: %r", creds)
+        for callback in subscribers:
+            try:
+                callback(old, creds)
+            except Exception as e:
+                log.exception("Credential subscriber error: %s", e)
+
+    # --- Change notifications ---
+    def subscribe(self, callback):
+        """callback(old, new) runs on whichever thread made the change."""
+        with self._cond:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._cond:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def start(self):
+        """Starts the creds.json watcher (idempotent)."""
+        with self._cond:
+            if self._thread is not None:
+                return self
+            self._thread = threading.Thread(target=self._watch, name="creds-watcher", daemon=True)
+        self.reload()
+        self._thread.start()
+        return self
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.reload()
+            except Exception as e:
+                log.error("Credential watcher error: %s", e)
+
+    def stats(self):
+        return {"changes": self.changes, "reloads": self.reloads, "errors": self.errors}
+
+
+def account_entry(data, name):
+    """The entry called `name` in a multi-account file, or None."""
+    for entry in data.get("accounts", []):
+        if entry.get("name") == name:
+            return entry
+    return None
+
+
+def account_names(path):
+    """Names of the accounts in a multi-account file, in file order."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return [entry["name"] for entry in data.get("accounts", []) if entry.get("name")]
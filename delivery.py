@@ -0,0 +1,448 @@
+import json
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from collections import deque
+
+log = logging.getLogger("delivery")
+
+# ==========================================================
+# === TELEGRAM DELIVERY SCHEDULER
+# ==========================================================
+# Every Bot API call goes through one scheduler:
+#   - a token bucket sized for Telegram's per-chat limit (groups: ~20/min),
+#   - two priority lanes: short "call detected" messages always go before
+#     audio uploads, and one worker only ever serves the message lane so a
+#     burst of large uploads cannot starve notifications,
+#   - 429 `retry_after` pauses the whole bucket, other transient failures
+#     are retried with exponential backoff, everything else is counted,
+#   - each lane has its own cap on accepted-but-unfinished jobs. A full
+#     message lane drops (the message is stale by then anyway); the audio
+#     lane never drops because of its depth, it makes the submitter wait
+#     instead, so download workers stop fetching (and buffering)
+#     recordings while uploads are behind. Audio depth never affects the
+#     message lane.
+# The async engine sends through deliver_async() on its own loop instead
+# of the worker threads, against the same bucket, retry policy and stats.
+
+PRIORITY_MESSAGE = 0
+PRIORITY_AUDIO = 1
+LANE_NAMES = {PRIORITY_MESSAGE: "message", PRIORITY_AUDIO: "audio"}
+
+
+class TokenBucket:
+    """Thread-safe token bucket with an optional hard pause (retry_after)."""
+
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.paused_until = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self):
+        """Takes a token and returns 0, or returns how long to wait for one."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def give_back(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+
+class DeliveryJob:
+    __slots__ = ("priority", "seq", "label", "send", "cleanup", "on_result", "enqueued_at", "attempts")
+
+    def __init__(self, priority, seq, label, send, cleanup, on_result=None):
+        self.priority = priority
+        self.seq = seq
+        self.label = label
+        self.send = send
+        self.cleanup = cleanup
+        self.on_result = on_result
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+def retry_after_from(response):
+    """Reads `parameters.retry_after` from a 429 Bot API response."""
+    try:
+        return float(response.json().get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        try:
+            return float(response.headers.get("Retry-After", 1))
+        except Exception:
+            return 1.0
+
+
+def retry_after_from_body(body):
+    """Same as retry_after_from, for a response body already read as text."""
+    try:
+        return float(json.loads(body).get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+
+class DeliveryScheduler:
+    def __init__(self, rate_per_minute=20, burst=3, workers=3, max_attempts=5,
+                 max_queue=500, max_audio_queue=16, backoff_base=1.0, backoff_max=60.0):
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst)
+        self.workers = max(2, workers)
+        self.max_attempts = max_attempts
+        self.limits = {PRIORITY_MESSAGE: max_queue, PRIORITY_AUDIO: max_audio_queue}
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started = False
+
+        # --- Metrics ---
+        self.submitted = {PRIORITY_MESSAGE: 0, PRIORITY_AUDIO: 0}
+        self.delivered = {PRIORITY_MESSAGE: 0, PRIORITY_AUDIO: 0}
+        self.dropped = {PRIORITY_MESSAGE: 0, PRIORITY_AUDIO: 0}
+        # Accepted and not finished yet: queued, waiting to retry or sending.
+        self.pending = {PRIORITY_MESSAGE: 0, PRIORITY_AUDIO: 0}
+        self.audio_waits = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.latencies = {PRIORITY_MESSAGE: deque(maxlen=512), PRIORITY_AUDIO: deque(maxlen=512)}
+        self.in_flight = 0
+        # deliver_async() callers waiting for a token, per lane (loop thread only).
+        self._async_waiting = {PRIORITY_MESSAGE: 0, PRIORITY_AUDIO: 0}
+
+    # --- Public API ---
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            # Worker 0 is reserved for the message lane.
+            lanes = (PRIORITY_MESSAGE,) if i == 0 else (PRIORITY_MESSAGE, PRIORITY_AUDIO)
+            t = threading.Thread(target=self._worker, args=(lanes,), name=f"tg-delivery-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, priority, label, send, cleanup=None, on_result=None, timeout=0):
+        """
+        Queues `send()` (must return a requests.Response). `cleanup()` runs
+        exactly once after the job is delivered or dropped, followed by
+        `on_result(delivered)`. If the lane is full, waits up to `timeout`
+        seconds (None = until there is room) before dropping.
+        """
+        self.start()
+        with self._cond:
+            self.submitted[priority] += 1
+            drop = not self._wait_for_room(priority, timeout)
+            if drop:
+                self.dropped[priority] += 1
+                log.warning("%s lane full (%d), dropping %s", LANE_NAMES[priority], self.limits[priority], label)
+            else:
+                self.pending[priority] += 1
+                heapq.heappush(self._heap, DeliveryJob(priority, next(self._seq), label, send, cleanup, on_result))
+                self._cond.notify_all()
+        if drop:
+            self._run_cleanup_for(cleanup)
+            self._report(on_result, False)
+        return not drop
+
+    def submit_message(self, label, send, cleanup=None, on_result=None):
+        """Never waits: drops if the message lane is full."""
+        return self.submit(PRIORITY_MESSAGE, label, send, cleanup, on_result)
+
+    def submit_audio(self, label, send, cleanup=None, on_result=None, timeout=None):
+        """Waits (blocking the download worker) while the audio lane is full."""
+        return self.submit(PRIORITY_AUDIO, label, send, cleanup, on_result, timeout)
+
+    def wait_for_audio_room(self, timeout=None):
+        """
+        Called by download workers before fetching a recording, so they
+        wait with nothing buffered. False if still full after `timeout`.
+        """
+        with self._cond:
+            return self._wait_for_room(PRIORITY_AUDIO, timeout)
+
+    def _wait_for_room(self, priority, timeout):
+        """With self._cond held. None = no time limit."""
+        limit = self.limits[priority]
+        if self.pending[priority] < limit:
+            return True
+        if priority == PRIORITY_AUDIO:
+            self.audio_waits += 1
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending[priority] >= limit:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._cond.wait(timeout=remaining if remaining is not None else 1.0)
+        return True
+
+    # --- Worker side ---
+    def _peek_lane(self, lanes):
+        """Index of the best queued job this worker may take, or None."""
+        if not self._heap:
+            return None
+        if self._heap[0].priority in lanes:
+            return 0
+        best = None
+        for i, job in enumerate(self._heap):
+            if job.priority in lanes and (best is None or job < self._heap[best]):
+                best = i
+        return best
+
+    def _take(self, lanes):
+        with self._cond:
+            while True:
+                idx = self._peek_lane(lanes)
+                if idx is not None:
+                    break
+                self._cond.wait(timeout=1.0)
+            # Hold a token before popping so the job picked is the best one
+            # available at the moment we are actually allowed to send.
+            while True:
+                wait = self.bucket.try_acquire()
+                if wait <= 0:
+                    break
+                self._cond.wait(timeout=wait)
+            idx = self._peek_lane(lanes)
+            if idx is None:
+                self.bucket.give_back()
+                return None
+            job = self._heap[idx]
+            self._heap[idx] = self._heap[-1]
+            self._heap.pop()
+            if idx < len(self._heap):
+                heapq.heapify(self._heap)
+            self.in_flight += 1
+            return job
+
+    def _requeue_later(self, job, delay):
+        def push():
+            with self._cond:
+                heapq.heappush(self._heap, job)
+                self._cond.notify_all()
+        timer = threading.Timer(delay, push)
+        timer.daemon = True
+        timer.start()
+
+    def _backoff(self, attempts):
+        return min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+
+    def _finish(self, job, delivered):
+        with self._cond:
+            self.pending[job.priority] -= 1
+            self._cond.notify_all()
+        if delivered:
+            self.delivered[job.priority] += 1
+            self.latencies[job.priority].append(time.monotonic() - job.enqueued_at)
+        else:
+            self.dropped[job.priority] += 1
+        self._run_cleanup_for(job.cleanup)
+        self._report(job.on_result, delivered)
+
+    def _report(self, on_result, delivered):
+        if on_result is None:
+            return
+        try:
+            on_result(delivered)
+        except Exception as e:
+            log.exception("Result callback error: %s", e)
+
+    def _run_cleanup_for(self, cleanup):
+        if cleanup is None:
+            return
+        try:
+            cleanup()
+        except Exception as e:
+            log.warning("Cleanup error: %s", e)
+
+    def _worker(self, lanes):
+        while True:
+            job = self._take(lanes)
+            if job is None:
+                continue
+            try:
+                self._attempt(job)
+            finally:
+                with self._cond:
+                    self.in_flight -= 1
+
+    def _attempt(self, job):
+        job.attempts += 1
+        try:
+            r = job.send()
+        except Exception as e:
+            r = None
+            error = str(e)
+
+        if r is not None and r.ok:
+            self._finish(job, True)
+            return
+
+        if r is not None and r.status_code == 429:
+            retry_after = retry_after_from(r)
+            self.rate_limited += 1
+            self.bucket.pause(retry_after)
+            log.warning("Rate limited, retry after %ss (%s)", retry_after, job.label)
+            if job.attempts < self.max_attempts * 2:
+                self.retries += 1
+                self._requeue_later(job, retry_after)
+                return
+        elif r is None or r.status_code >= 500:
+            if r is not None:
+                error = f"HTTP {r.status_code}"
+            if job.attempts < self.max_attempts:
+                delay = self._backoff(job.attempts)
+                self.retries += 1
+                log.info("%s failed (%s), retry %d in %.1fs", job.label, error, job.attempts, delay)
+                self._requeue_later(job, delay)
+                return
+        else:
+            log.error("%s rejected: %s", job.label, r.text[:200])
+            self._finish(job, False)
+            return
+
+        log.error("Giving up on %s after %d attempts", job.label, job.attempts)
+        self._finish(job, False)
+
+    # --- asyncio path (async engine) ---
+    async def deliver_async(self, priority, label, send):
+        """
+        Sends `await send()` -> (status, body text) with the same token
+        bucket, 429 pause and retry/backoff policy as the worker threads;
+        a queued message still goes before any audio. Waits until the
+        send finished or was given up and returns whether it was delivered.
+        """
+        with self._cond:
+            self.submitted[priority] += 1
+            self.pending[priority] += 1
+        enqueued_at = time.monotonic()
+        delivered = False
+        attempts = 0
+        try:
+            while True:
+                await self._acquire_async(priority)
+                attempts += 1
+                with self._cond:
+                    self.in_flight += 1
+                try:
+                    status, body = await send()
+                    error = f"HTTP {status}"
+                except Exception as e:
+                    status, body, error = None, "", str(e)
+                finally:
+                    with self._cond:
+                        self.in_flight -= 1
+
+                if status == 200:
+                    delivered = True
+                    return True
+
+                if status == 429:
+                    retry_after = retry_after_from_body(body)
+                    self.rate_limited += 1
+                    self.bucket.pause(retry_after)
+                    log.warning("Rate limited, retry after %ss (%s)", retry_after, label)
+                    if attempts < self.max_attempts * 2:
+                        self.retries += 1
+                        await asyncio.sleep(retry_after)
+                        continue
+                elif status is None or status >= 500:
+                    if attempts < self.max_attempts:
+                        delay = self._backoff(attempts)
+                        self.retries += 1
+                        log.info("%s failed (%s), retry %d in %.1fs", label, error, attempts, delay)
+                        await asyncio.sleep(delay)
+                        continue
+                else:
+                    log.error("%s rejected: %s", label, body[:200])
+                    return False
+
+                log.error("Giving up on %s after %d attempts", label, attempts)
+                return False
+        finally:
+            with self._cond:
+                self.pending[priority] -= 1
+                self._cond.notify_all()
+            if delivered:
+                self.delivered[priority] += 1
+                self.latencies[priority].append(time.monotonic() - enqueued_at)
+            else:
+                self.dropped[priority] += 1
+
+    async def _acquire_async(self, priority):
+        """Waits for a token; audio also waits while any message is waiting for one."""
+        waiting = self._async_waiting
+        waiting[priority] += 1
+        try:
+            while True:
+                if priority == PRIORITY_AUDIO and waiting[PRIORITY_MESSAGE]:
+                    wait = 0.05
+                else:
+                    wait = self.bucket.try_acquire()
+                    if wait <= 0:
+                        return
+                await asyncio.sleep(wait)
+        finally:
+            waiting[priority] -= 1
+
+    # --- Metrics ---
+    @staticmethod
+    def _percentile(values, pct):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+    def stats(self):
+        with self._cond:
+            depth = {name: 0 for name in LANE_NAMES.values()}
+            for job in self._heap:
+                depth[LANE_NAMES[job.priority]] += 1
+            in_flight = self.in_flight
+            pending = {LANE_NAMES[p]: n for p, n in self.pending.items()}
+        stats = {
+            "queue_depth": depth,
+            "pending": pending,
+            "audio_waits": self.audio_waits,
+            "in_flight": in_flight,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
+        for priority, name in LANE_NAMES.items():
+            latencies = list(self.latencies[priority])
+            stats[name] = {
+                "submitted": self.submitted[priority],
+                "delivered": self.delivered[priority],
+                "dropped": self.dropped[priority],
+                "latency_p50": self._percentile(latencies, 50),
+                "latency_p95": self._percentile(latencies, 95),
+                "latency_max": max(latencies) if latencies else 0.0,
+            }
+        return stats
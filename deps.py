@@ -0,0 +1,68 @@
+"""
+On-request dependency check. Nothing is installed or imported at boot any
+more; run this after deploying (or when something fails to import):
+
+    python deps.py              # report, exit 1 if anything is missing
+    python deps.py --install    # pip install whatever is missing
+
+Modules are located with importlib.util.find_spec, so the check itself
+does not import (or pay the start-up cost of) any of them.
+"""
+import sys
+import shutil
+import subprocess
+import importlib.util
+
+# (import name, pip requirement, what needs it)
+DEPENDENCIES = [
+    ("requests", "requests", "recording downloads, Bot API"),
+    ("socketio", "python-socketio[client,asyncio_client]", "live call feed"),
+    ("telegram", "python-telegram-bot", "/update bot"),
+    ("pycountry", "pycountry", "country flags (loaded on first lookup)"),
+    ("aiohttp", "aiohttp", "SCRAPER_ENGINE=async"),
+    ("flask", "Flask", "/metrics and /healthz"),
+]
+
+
+# Optional, reported but never fatal.
+# (import name, what needs it)
+OPTIONAL_MODULES = [
+    ("orjson", "faster socket frame decoding (or ujson; stdlib json otherwise)"),
+]
+# (executable, what needs it)
+OPTIONAL_BINARIES = [
+    ("ffmpeg", "TRANSCODE_WAV=1"),
+]
+
+
+def missing_dependencies():
+    """Returns [(module, requirement, purpose)] for every module that cannot be found."""
+    return [dep for dep in DEPENDENCIES if importlib.util.find_spec(dep[0]) is None]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    missing = missing_dependencies()
+
+    for module, requirement, purpose in DEPENDENCIES:
+        status = "MISSING" if (module, requirement, purpose) in missing else "ok"
+        print(f"  {status:8} {module:10} {purpose}")
+    for module, purpose in OPTIONAL_MODULES:
+        status = "ok" if importlib.util.find_spec(module) else "absent"
+        print(f"  {status:8} {module:10} {purpose} (optional)")
+    for binary, purpose in OPTIONAL_BINARIES:
+        status = "ok" if shutil.which(binary) else "absent"
+        print(f"  {status:8} {binary:10} {purpose} (optional)")
+
+    if not missing:
+        return 0
+
+    cmd = [sys.executable, "-m", "pip", "install"] + [requirement for (_, requirement, _) in missing]
+    if "--install" in argv:
+        return subprocess.call(cmd)
+    print("Install with: " + " ".join(f'"{c}"' if "[" in c else c for c in cmd))
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==========================================================
+# === SHARED RECORDING DOWNLOAD CLIENT
+# ==========================================================
+# One long-lived requests.Session with a sized connection pool, owned by
+# the scraper loop and shared by every download worker, so recordings
+# reuse kept-alive TLS connections to orangecarrier.com instead of paying
+# a fresh handshake per call.
+
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
+    "Referer": "https://www.orangecarrier.com/live/calls",
+    "accept": "*/*",
+    "accept-language": "en-US,en;q:0.9",
+    "range": "bytes:0-",
+    "sec-fetch-dest": "audio",
+    "sec-fetch-mode": "no-cors",
+    "sec-fetch-site": "same-origin",
+    "Connection": "keep-alive",
+}
+
+
+class DownloadClient:
+    """Pooled, keep-alive session for recording downloads."""
+
+    def __init__(self, cookie_jar, base_headers=None, pool_maxsize=10, timeout=30):
+        self.timeout = timeout
+        self.downloads = 0
+        self.cookie_swaps = 0
+        self._lock = threading.Lock()
+
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=False)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.cookies.update(cookie_jar)
+        if base_headers:
+            self.session.headers.update(base_headers)
+        self.session.headers.update(DOWNLOAD_HEADERS)
+
+    @classmethod
+    def from_session(cls, http_session, **kwargs):
+        """Builds a client from the scraper's cookies and headers."""
+        return cls(http_session.cookies, http_session.headers, **kwargs)
+
+    def swap_cookies(self, cookie_jar):
+        """
+        Replaces the session's cookies in one assignment. Requests already
+        in flight keep the jar they were prepared with, the next one uses
+        the new jar, and the pooled connections stay open.
+        """
+        self.session.cookies = cookie_jar
+        with self._lock:
+            self.cookie_swaps += 1
+
+    def get(self, url, **kwargs):
+        """Streaming GET; use as a context manager so the connection goes back to the pool."""
+        with self._lock:
+            self.downloads += 1
+        kwargs.setdefault("stream", True)
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def pool_stats(self):
+        """
+        Connection reuse per host. `requests` is the number of HTTP requests
+        sent through the pool, `connections` the number of TCP+TLS
+        connections it had to open; the difference is handshakes saved.
+        """
+        stats = {
+            "downloads": self.downloads, "cookie_swaps": self.cookie_swaps,
+            "connections": 0, "requests": 0, "reused": 0, "hosts": {}
+        }
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened = getattr(pool, "num_connections", 0)
+            sent = getattr(pool, "num_requests", 0)
+            stats["hosts"][f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections": opened,
+                "requests": sent,
+                "reused": max(0, sent - opened),
+            }
+            stats["connections"] += opened
+            stats["requests"] += sent
+        stats["reused"] = max(0, stats["requests"] - stats["connections"])
+        return stats
+
+    def close(self):
+        self.session.close()
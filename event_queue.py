@@ -0,0 +1,221 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+log = logging.getLogger("scraper")
+
+# ==========================================================
+# === CALL EVENT QUEUE (SOCKET THREAD -> CONSUMER THREAD)
+# ==========================================================
+# The Socket.IO callback only appends the raw frame here; a dedicated
+# consumer thread applies it to the CallHandler. Every `call` frame carries
+# the full page snapshot, so when frames pile up the consumer merges them
+# into one (latest snapshot + every `end` entry) instead of replaying each.
+
+
+def _iter_page_calls(page_list):
+    for call_list_on_page in page_list or []:
+        if isinstance(call_list_on_page, dict):
+            call_iterable = call_list_on_page.values()
+        else:
+            call_iterable = call_list_on_page
+        for call in call_iterable:
+            if isinstance(call, dict):
+                yield call
+
+
+def coalesce_frames(frames):
+    """
+    Merges several `call` frames (oldest first) into one equivalent frame.
+    Keeps the newest page snapshot, every `end` entry, and any call that
+    only appeared in an older snapshot but ended since (so it still gets
+    detected and downloaded).
+    """
+    if len(frames) == 1:
+        return frames[0]
+
+    latest_calls = (frames[-1] or {}).get('calls', {}) or {}
+    page_list = list(latest_calls.get('calls', []) or [])
+
+    ended = {}
+    for frame in frames:
+        for call_data in ((frame or {}).get('calls', {}) or {}).get('end', []) or []:
+            uuid = call_data.get('uuid') if isinstance(call_data, dict) else None
+            if uuid:
+                ended[uuid] = call_data
+
+    if ended:
+        on_latest_page = {c.get('uuid') for c in _iter_page_calls(page_list)}
+        salvaged = {}
+        for frame in frames[:-1]:
+            for call in _iter_page_calls(((frame or {}).get('calls', {}) or {}).get('calls', [])):
+                uuid = call.get('uuid')
+                if uuid in ended and uuid not in on_latest_page:
+                    salvaged[uuid] = call
+        if salvaged:
+            page_list.append(list(salvaged.values()))
+
+    merged_calls = dict(latest_calls)
+    merged_calls['calls'] = page_list
+    merged_calls['end'] = list(ended.values())
+    merged = dict(frames[-1] or {})
+    merged['calls'] = merged_calls
+    return merged
+
+
+class CallEventQueue:
+    """Bounded frame queue with a single consumer thread."""
+
+    def __init__(self, apply_frame, maxsize=256):
+        self.apply_frame = apply_frame
+        self.maxsize = max(2, maxsize)
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+
+        # --- Metrics ---
+        self.frames_received = 0
+        self.frames_applied = 0
+        self.frames_coalesced = 0
+        self.overflow_merges = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    # --- Producer side (Socket.IO thread) ---
+    def put(self, data):
+        now = time.monotonic()
+        with self._cond:
+            self._frames.append((now, data))
+            self.frames_received += 1
+            if len(self._frames) > self.maxsize:
+                # Full: fold the two oldest frames together instead of dropping.
+                (t_old, f_old) = self._frames.popleft()
+                (_, f_next) = self._frames.popleft()
+                self._frames.appendleft((t_old, coalesce_frames([f_old, f_next])))
+                self.overflow_merges += 1
+                self.frames_coalesced += 1
+            depth = len(self._frames)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            self._cond.notify()
+
+    # --- Consumer side ---
+    def _take_batch(self):
+        with self._cond:
+            while self._running and not self._frames:
+                self._cond.wait(timeout=1.0)
+            batch = list(self._frames)
+            self._frames.clear()
+        return batch
+
+    def _apply_batch(self, batch):
+        oldest_enqueued = batch[0][0]
+        frames = [data for (_, data) in batch]
+        if len(frames) > 1:
+            self.frames_coalesced += len(frames) - 1
+        frame = coalesce_frames(frames)
+
+        lag = time.monotonic() - oldest_enqueued
+        self.last_lag = lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+        try:
+            self.apply_frame(frame)
+        except Exception as e:
+            log.exception("Event consumer error: %s", e)
+        self.frames_applied += 1
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._apply_batch(batch)
+            elif not self._running:
+                return
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="call-event-consumer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stops the consumer after draining whatever is still queued."""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def depth(self):
+        return len(self._frames)
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "frames_received": self.frames_received,
+            "frames_applied": self.frames_applied,
+            "frames_coalesced": self.frames_coalesced,
+            "overflow_merges": self.overflow_merges,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+        }
+
+
+class AsyncCallEventQueue(CallEventQueue):
+    """Same queue for the asyncio engine: the consumer is a task, not a thread."""
+
+    def __init__(self, apply_frame, maxsize=256):
+        super().__init__(apply_frame, maxsize)
+        self._wakeup = None
+        self._task = None
+
+    def put(self, data):
+        super().put(data)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _drain(self):
+        with self._cond:
+            batch = list(self._frames)
+            self._frames.clear()
+        return batch
+
+    async def _run_async(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch = self._drain()
+            if batch:
+                self._apply_batch(batch)
+            if not self._running:
+                return
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run_async())
+
+    async def stop(self, timeout=5):
+        """Stops the consumer task after draining whatever is still queued."""
+        self._running = False
+        if self._task is None:
+            return
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
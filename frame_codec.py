@@ -0,0 +1,87 @@
+import os
+import json as stdlib_json
+import importlib
+from operator import itemgetter
+
+# ==========================================================
+# === FAST FRAME DECODING
+# ==========================================================
+# Every `call` frame carries the full nested page list, so decoding it is
+# most of the socket thread's work on busy accounts. Socket.IO and
+# Engine.IO packets are decoded with whichever of orjson / ujson is
+# installed (stdlib json otherwise), chosen once at import:
+#
+#   SCRAPER_JSON  auto (default) | orjson | ujson | stdlib
+#
+# Outgoing packets are tiny and need json.dumps' keyword arguments, so
+# they always use the stdlib encoder.
+#
+# extract_frame() then pulls only the fields the call state needs out of
+# the decoded frame, as flat tuples:
+#   rows   [(uuid, status, duration, cid_num, termination), ...]
+#   ended  [(uuid, duration or None), ...]
+# A page whose calls all carry the five fields is converted in one
+# map(itemgetter) pass; a page with a call missing one falls back to
+# per-call .get() with the same defaults the handler always used. Rows
+# may have an empty uuid; CallStateStore skips those.
+
+FAST_DECODERS = ("orjson", "ujson")
+ROW_FIELDS = itemgetter('uuid', 'status', 'duration', 'cid_num', 'termination')
+
+
+class JsonModule:
+    """The json-like object python-socketio's `json=` parameter expects."""
+
+    def __init__(self, name, loads):
+        self.name = name
+        self.loads = loads
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return stdlib_json.dumps(obj, **kwargs)
+
+    def __repr__(self):
+        return f"<JsonModule {self.name}>"
+
+
+def load_decoder(preference="auto"):
+    """JsonModule for `preference`; falls back to stdlib if it is not installed."""
+    candidates = FAST_DECODERS if preference == "auto" else (preference,)
+    for name in candidates:
+        if name == "stdlib":
+            break
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        return JsonModule(name, module.loads)
+    return JsonModule("stdlib", stdlib_json.loads)
+
+
+socket_json = load_decoder(os.environ.get("SCRAPER_JSON", "auto").lower())
+
+
+def extract_rows(page_list):
+    """Flattens the page list (lists or {index: call} dicts) into row tuples."""
+    rows = []
+    for page in page_list or ():
+        calls = page.values() if isinstance(page, dict) else page
+        try:
+            rows += list(map(ROW_FIELDS, calls))
+        except KeyError:
+            rows += [
+                (call.get('uuid'), call.get('status'), call.get('duration', '0'),
+                 call.get('cid_num', 'Unknown'), call.get('termination', 'UNKNOWN'))
+                for call in calls
+            ]
+    return rows
+
+
+def extract_ended(ended_calls_list):
+    return [(call.get('uuid'), call.get('duration')) for call in ended_calls_list or ()]
+
+
+def extract_frame(data):
+    """(rows, ended) for one decoded `call` frame."""
+    calls_data = data.get('calls') or {}
+    return extract_rows(calls_data.get('calls')), extract_ended(calls_data.get('end'))
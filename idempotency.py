@@ -0,0 +1,161 @@
+import time
+import hashlib
+import sqlite3
+import threading
+
+# ==========================================================
+# === DELIVERED-RECORDING INDEX (IDEMPOTENT DOWNLOAD/UPLOAD)
+# ==========================================================
+# Remembers every recording that reached Telegram, keyed two ways:
+#   - (uuid, did): a replayed `end`, a stale prune racing a late `end`,
+#     or a restart re-submitting a call is skipped before downloading,
+#   - content hash (computed on the chunks as they stream in): the same
+#     audio for the same number, delivered within `content_window`
+#     seconds, is skipped before uploading (a call replayed under a new
+#     uuid). Different numbers, or the same number much later, are never
+#     matched by content: silent/placeholder recordings are byte-identical
+#     across calls.
+# Non-audio bodies (the HTML login page served once the cookie expired)
+# take no part in content matching and are never recorded as delivered.
+# Calls currently being downloaded/uploaded are tracked in memory, so two
+# submissions of the same call in quick succession run only once.
+# The SQLite file is trimmed back to the newest `max_entries` rows every
+# `prune_every` deliveries, so its size stays bounded.
+
+
+def content_hasher():
+    """Incremental hash fed with each downloaded chunk."""
+    return hashlib.blake2b(digest_size=16)
+
+
+class DeliveredIndex:
+    def __init__(self, db_path, max_entries=100000, prune_every=1000, content_window=3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.content_window = content_window
+        self.prune_every = prune_every
+
+        self.suppressed_calls = 0
+        self.suppressed_content = 0
+        self.recorded = 0
+
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS delivered (
+                uuid TEXT NOT NULL,
+                did TEXT NOT NULL,
+                content_hash TEXT,
+                delivered REAL NOT NULL,
+                PRIMARY KEY (uuid, did)
+            );
+            CREATE INDEX IF NOT EXISTS delivered_hash ON delivered (content_hash);
+        """)
+
+    def claim(self, uuid, did, on_result=None):
+        """A Claim for (uuid, did), or None if it must be skipped."""
+        if not self.begin(uuid, did):
+            return None
+        return Claim(self, uuid, did, on_result)
+
+    # --- Before downloading ---
+    def begin(self, uuid, did):
+        """
+        Claims (uuid, did) for a download. False if it was already
+        delivered or is in flight right now (counted as suppressed).
+        """
+        key = (uuid, did)
+        with self._lock:
+            if key in self._in_flight or self._conn.execute(
+                "SELECT 1 FROM delivered WHERE uuid = ? AND did = ?", key
+            ).fetchone():
+                self.suppressed_calls += 1
+                return False
+            self._in_flight.add(key)
+            return True
+
+    # --- After downloading, before uploading ---
+    def seen_content(self, digest, did):
+        """True (and counted) if this number's recording with this hash was delivered recently."""
+        with self._lock:
+            if self._conn.execute(
+                "SELECT 1 FROM delivered WHERE content_hash = ? AND did = ? AND delivered >= ? LIMIT 1",
+                (digest, did, time.time() - self.content_window)
+            ).fetchone():
+                self.suppressed_content += 1
+                return True
+            return False
+
+    # --- Outcome ---
+    def finish(self, uuid, did, digest, delivered):
+        """Releases the claim; a delivered recording is remembered."""
+        with self._lock:
+            self._in_flight.discard((uuid, did))
+            if not delivered:
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO delivered (uuid, did, content_hash, delivered) VALUES (?, ?, ?, ?)",
+                    (uuid, did, digest, time.time())
+                )
+            self.recorded += 1
+            if self.recorded % self.prune_every == 0:
+                self._prune()
+
+    def _prune(self):
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM delivered WHERE rowid <= (SELECT MAX(rowid) FROM delivered) - ?",
+                (self.max_entries,)
+            )
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM delivered").fetchone()[0]
+            in_flight = len(self._in_flight)
+        return {
+            "entries": entries,
+            "in_flight": in_flight,
+            "suppressed_calls": self.suppressed_calls,
+            "suppressed_content": self.suppressed_content,
+        }
+
+
+class Claim:
+    """
+    One claimed (uuid, did) on its way through download and upload.
+    on_result(delivered) records the outcome (with the content hash) and
+    then calls the caller's own on_result.
+    """
+
+    __slots__ = ("index", "uuid", "did", "digest", "audio", "callback")
+
+    def __init__(self, index, uuid, did, callback=None):
+        self.index = index
+        self.uuid = uuid
+        self.did = did
+        self.digest = None
+        self.audio = True
+        self.callback = callback
+
+    def duplicate_content(self, digest, audio=True):
+        """True if the same number's recording was just delivered. Non-audio is never matched."""
+        if not audio:
+            self.audio = False
+            return False
+        self.digest = digest
+        return self.index.seen_content(digest, self.did)
+
+    def on_result(self, delivered):
+        # A non-audio body is released, not remembered: a later retry
+        # (after re-login) may still fetch the real recording.
+        self.index.finish(self.uuid, self.did, self.digest, delivered and self.audio)
+        if self.callback is not None:
+            self.callback(delivered)
+
+    def abandon(self):
+        """Download failed: release the claim without recording anything."""
+        self.index.finish(self.uuid, self.did, None, False)
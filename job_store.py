@@ -0,0 +1,313 @@
+import os
+import glob
+import time
+import queue
+import logging
+import sqlite3
+import threading
+
+log = logging.getLogger("jobs")
+
+# ==========================================================
+# === DURABLE DOWNLOAD/UPLOAD JOB QUEUE (SQLITE, WAL)
+# ==========================================================
+# "call ended -> download -> upload" jobs are written to SQLite so they
+# survive socket restarts and crashes. The event path never touches the
+# database: enqueue() only appends to an in-memory list, and a single
+# writer thread commits everything pending in one transaction every
+# `flush_interval` seconds, then hands the committed jobs to the workers.
+# The workers are plain threads that outlive individual socket sessions.
+
+PENDING = "pending"
+RUNNING = "running"
+UPLOADING = "uploading"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT NOT NULL,
+    did TEXT NOT NULL,
+    country TEXT,
+    duration TEXT,
+    url TEXT NOT NULL,
+    account TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    UNIQUE (uuid, did)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+
+class Job:
+    __slots__ = ("id", "uuid", "did", "country", "duration", "url", "attempts", "uploaded", "account")
+
+    def __init__(self, uuid, did, country, duration, url, attempts=0, id=None, account=None):
+        self.id = id
+        self.account = account
+        self.uuid = uuid
+        self.did = did
+        self.country = country
+        self.duration = duration
+        self.url = url
+        self.attempts = attempts
+        self.uploaded = False
+
+    def __repr__(self):
+        return f"Job({self.id}, uuid={self.uuid}, did={self.did}, attempts={self.attempts})"
+
+    def log_fields(self):
+        return {"uuid": self.uuid, "did": self.did, "country": self.country}
+
+
+class DownloadJobQueue:
+    def __init__(self, db_path, process, workers=10, max_attempts=3,
+                 flush_interval=0.05, retry_delay=10, keep_finished_seconds=7 * 86400,
+                 ready=None, defer_delay=1):
+        """
+        process(job, on_uploaded) -> bool
+            Runs the download and hands the recording to delivery. Returns
+            False if the download failed. on_uploaded(delivered) is called
+            once the upload finished (or was dropped), possibly before
+            process returns; an attempt that reported through it is not
+            retried again for its return value.
+        ready(job) -> bool
+            Whether the job can run yet (e.g. its download pool exists).
+            A job that cannot is put back after `defer_delay` seconds
+            without using up an attempt, so jobs resumed at boot wait
+            for credentials instead of failing.
+        """
+        self.db_path = db_path
+        self.process = process
+        self.ready = ready
+        self.defer_delay = defer_delay
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.flush_interval = flush_interval
+        self.retry_delay = retry_delay
+        self.keep_finished_seconds = keep_finished_seconds
+
+        self._new_jobs = []
+        self._updates = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._ready = queue.Queue()
+        self._started = False
+
+        # --- Metrics ---
+        self.enqueued = 0
+        self.duplicates = 0
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.resumed = 0
+        self.deferred = 0
+        self.flushes = 0
+        self.orphans_removed = 0
+
+    # --- Lifecycle ---
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        conn = self._connect()
+        try:
+            conn.executescript(SCHEMA)
+            self._migrate(conn)
+            self._purge_finished(conn)
+            self._resume(conn)
+        finally:
+            conn.close()
+        self._cleanup_orphans()
+
+        threading.Thread(target=self._writer, name="job-writer", daemon=True).start()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self, conn):
+        """Adds columns introduced after a database was created."""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "account" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN account TEXT")
+            conn.commit()
+
+    def _resume(self, conn):
+        rows = conn.execute(
+            "SELECT id, uuid, did, country, duration, url, attempts, account FROM jobs "
+            "WHERE state IN (?, ?, ?) ORDER BY id",
+            (PENDING, RUNNING, UPLOADING)
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE jobs SET state = ?, updated = ? WHERE state IN (?, ?)",
+                (PENDING, time.time(), RUNNING, UPLOADING)
+            )
+            conn.commit()
+        for (id, uuid, did, country, duration, url, attempts, account) in rows:
+            self._ready.put(Job(uuid, did, country, duration, url, attempts, id, account))
+        self.resumed = len(rows)
+        if rows:
+            log.info("Resuming %d unfinished job(s) from %s", len(rows), self.db_path)
+
+    def _purge_finished(self, conn):
+        cutoff = time.time() - self.keep_finished_seconds
+        conn.execute("DELETE FROM jobs WHERE state IN (?, ?) AND updated < ?", (DONE, FAILED, cutoff))
+        conn.commit()
+
+    def _cleanup_orphans(self):
+        """rec_* files left in the CWD belong to downloads that never finished."""
+        for path in glob.glob("rec_*"):
+            try:
+                os.remove(path)
+                self.orphans_removed += 1
+            except OSError:
+                pass
+        if self.orphans_removed:
+            log.info("Removed %d orphaned recording file(s)", self.orphans_removed)
+
+    # --- Event path ---
+    def enqueue(self, uuid, did, country, duration, url, account=None):
+        """Non-blocking: the job is committed by the writer thread."""
+        with self._lock:
+            self._new_jobs.append(Job(uuid, did, country, duration, url, account=account))
+            self.enqueued += 1
+        self._wakeup.set()
+
+    def _set_state(self, job, state, error=None):
+        with self._lock:
+            self._updates.append((state, job.attempts, error, time.time(), job.id))
+        self._wakeup.set()
+
+    # --- Writer thread ---
+    def _writer(self):
+        conn = self._connect()
+        last_purge = time.monotonic()
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.flush_interval)  # let the batch fill up
+            self._wakeup.clear()
+            with self._lock:
+                new_jobs, self._new_jobs = self._new_jobs, []
+                updates, self._updates = self._updates, []
+            if not new_jobs and not updates:
+                continue
+
+            ready = []
+            try:
+                with conn:
+                    now = time.time()
+                    for job in new_jobs:
+                        cur = conn.execute(
+                            "INSERT OR IGNORE INTO jobs (uuid, did, country, duration, url, state, attempts, created, updated, account) "
+                            "VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                            (job.uuid, job.did, job.country, job.duration, job.url, PENDING, now, now, job.account)
+                        )
+                        if cur.rowcount:
+                            job.id = cur.lastrowid
+                            ready.append(job)
+                        else:
+                            self.duplicates += 1
+                    if updates:
+                        conn.executemany(
+                            "UPDATE jobs SET state = ?, attempts = ?, error = ?, updated = ? WHERE id = ?",
+                            updates
+                        )
+                self.flushes += 1
+            except Exception as e:
+                log.warning("Write failed, retrying next flush: %s", e)
+                with self._lock:
+                    self._new_jobs[:0] = new_jobs
+                    self._updates[:0] = updates
+                self._wakeup.set()
+                time.sleep(1)
+                continue
+
+            for job in ready:
+                self._ready.put(job)
+
+            if time.monotonic() - last_purge > 3600:
+                self._purge_finished(conn)
+                last_purge = time.monotonic()
+
+    # --- Workers ---
+    def _worker(self):
+        while True:
+            job = self._ready.get()
+            if self.ready is not None and not self.ready(job):
+                self.deferred += 1
+                self._put_later(job, self.defer_delay)
+                continue
+            job.attempts += 1
+            job.uploaded = False
+            self._set_state(job, RUNNING)
+            reported = []
+
+            def on_uploaded(delivered, job=job, reported=reported):
+                reported.append(delivered)
+                self._uploaded(job, delivered)
+
+            try:
+                ok = self.process(job, on_uploaded)
+            except Exception as e:
+                log.exception("%s crashed: %s", job, e, extra=job.log_fields())
+                ok = False
+            if ok:
+                # The upload may already have finished on a delivery thread.
+                with self._lock:
+                    if not job.uploaded:
+                        self._updates.append((UPLOADING, job.attempts, None, time.time(), job.id))
+            elif not reported:
+                # A dropped upload was already retried by _uploaded().
+                self._retry_or_fail(job, "download failed")
+
+    def _uploaded(self, job, delivered):
+        with self._lock:
+            job.uploaded = True
+        if delivered:
+            self.completed += 1
+            self._set_state(job, DONE)
+        else:
+            self._retry_or_fail(job, "upload failed")
+
+    def _retry_or_fail(self, job, error):
+        if job.attempts < self.max_attempts:
+            self.retried += 1
+            self._set_state(job, PENDING, error)
+            self._put_later(job, self.retry_delay * job.attempts)
+        else:
+            self.failed += 1
+            log.error("Giving up on %s: %s", job, error, extra=job.log_fields())
+            self._set_state(job, FAILED, error)
+
+    def _put_later(self, job, delay):
+        timer = threading.Timer(delay, self._ready.put, args=(job,))
+        timer.daemon = True
+        timer.start()
+
+    def stats(self):
+        with self._lock:
+            unflushed = len(self._new_jobs) + len(self._updates)
+        return {
+            "enqueued": self.enqueued,
+            "duplicates": self.duplicates,
+            "ready": self._ready.qsize(),
+            "unflushed_writes": unflushed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "resumed": self.resumed,
+            "deferred": self.deferred,
+            "flushes": self.flushes,
+            "orphans_removed": self.orphans_removed,
+        }
@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# ==========================================================
+# === STRUCTURED, NON-BLOCKING LOGGING
+# ==========================================================
+# Every logger only puts records on a bounded in-memory queue; one
+# background thread (QueueListener) formats them and writes to stdout.
+# The socket thread and the workers therefore never wait on a slow log
+# pipe. If the writer falls behind and the queue fills up, records are
+# dropped and counted instead of blocking the caller.
+#
+#   LOG_LEVEL   DEBUG | INFO (default) | WARNING | ...
+#   LOG_FORMAT  json (default) | text
+#
+# Per-call correlation fields are passed with `extra=`:
+#   log.info("Call ended", extra={"uuid": uuid, "did": did, "country": country})
+# Per-process ones (e.g. the shard's account) are given to setup_logging().
+
+CORRELATION_FIELDS = ("shard", "uuid", "did", "country")
+LOG_QUEUE_SIZE = 10000
+
+# Third-party loggers that log every request at INFO.
+QUIET_LOGGERS = ("httpx", "werkzeug", "urllib3", "engineio.client", "socketio.client")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, correlation fields, exc."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CORRELATION_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable line with the correlation fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        fields = [
+            f"{field}={getattr(record, field)}"
+            for field in CORRELATION_FIELDS
+            if getattr(record, field, None) is not None
+        ]
+        return f"{line} {' '.join(fields)}" if fields else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: a full queue drops the record and counts it."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same as QueueHandler.prepare, but keeps the traceback in exc_text
+        # instead of folding it into msg, so the JSON formatter can split it.
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class ContextFilter(logging.Filter):
+    """Stamps fixed fields (e.g. shard=<account>) on every record."""
+
+    def __init__(self, fields):
+        super().__init__()
+        self.fields = fields
+
+    def filter(self, record):
+        for key, value in self.fields.items():
+            if getattr(record, key, None) is None:
+                setattr(record, key, value)
+        return True
+
+
+_handler = None
+_listener = None
+
+
+def setup_logging(level=None, fmt=None, stream=None, queue_size=LOG_QUEUE_SIZE, context=None):
+    """
+    Routes the root logger through the queue + background writer.
+    Safe to call more than once; later calls only change the level.
+    `context` fields are added to every record.
+    """
+    global _handler, _listener
+
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
+
+    if _listener is not None:
+        return _handler
+
+    fmt = (fmt or os.environ.get("LOG_FORMAT", "json")).lower()
+    writer = logging.StreamHandler(stream or sys.stdout)
+    writer.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    if context:
+        _handler.addFilter(ContextFilter(context))
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(_handler)
+
+    _listener = logging.handlers.QueueListener(_handler.queue, writer, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _handler
+
+
+def stop_logging():
+    """Flushes whatever is still queued and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats():
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
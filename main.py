@@ -1,15 +1,36 @@
+import time
+# Taken before the (heavy) imports below, for the start-up -> first
+# connected socket timing.
+PROCESS_STARTED = time.monotonic()
+
 import os
-import sys
 import re
-import time
 import requests
 import datetime
 import concurrent.futures
 import socketio
-import json
-import pycountry
+import io
+import random
+import asyncio
+import logging
+import tempfile
 import threading  # <-- 1. IMPORTED FOR PARALLEL EXECUTION
-from bs4 import BeautifulSoup
+from country_index import country_index, country_name_from_termination
+from event_queue import CallEventQueue, AsyncCallEventQueue
+from call_state import CallStateStore, UP, ENDED, STALE, EVICTED, parse_duration
+from frame_codec import extract_frame, socket_json
+from download_client import DownloadClient, DOWNLOAD_HEADERS
+from credentials import CredentialProvider, account_names
+from shards import ShardSupervisor
+from delivery import DeliveryScheduler, PRIORITY_MESSAGE, PRIORITY_AUDIO
+from notification_batcher import NotificationBatcher
+from job_store import DownloadJobQueue
+from media_cache import MediaCache
+from idempotency import DeliveredIndex, content_hasher
+from transcode import Transcoder
+from replay import FrameRecorder
+from metrics import registry, SIZE_BUCKETS
+import log_setup
 from http.cookiejar import CookieJar
 from requests.cookies import RequestsCookieJar
 from urllib.parse import urlencode
@@ -24,6 +45,7 @@ from telegram.ext import Application, CommandHandler, MessageHandler, Conversati
 TELEGRAM_BOT_TOKEN = "8068434240:AAF2xLDW3YJQ95wwYcI5Ir_m4x636EEIsck"
 TELEGRAM_CHAT_ID_INT = -1003175183012     # For the bot's filter (as an integer)
 TELEGRAM_CHAT_ID_STR = "-1003175183012"    # For sending messages (as a string)
+TELEGRAM_API_URL = "https://api.telegram.org"
 
 # --- FIXED CREDENTIALS ---
 # Token and User are now fixed, as requested
@@ -35,96 +57,154 @@ LIVE_URL = "https://www.orangecarrier.com/live/calls"
 SOCKET_URL = "wss://orangecarrier.com:8443"
 BASE_URL = "https://www.orangecarrier.com"
 CREDS_FILE = 'creds.json'
+CREDS_POLL_INTERVAL = 2   # seconds between creds.json change checks
+THUMBNAIL_FILE = 'thumbnail.png'
 
 # --- Conversation States for Bot (Only one state needed) ---
 GET_COOKIE = 0 # Only state 0 is needed
 
+# --- Capture raw `call` frames to JSONL for replay/benchmarks (None = off) ---
+CAPTURE_FRAMES_FILE = os.environ.get("CAPTURE_FRAMES_FILE")
+
+# --- Reconnect backoff (seconds) ---
+RECONNECT_DELAY_MIN = 1
+RECONNECT_DELAY_MAX = 60
+RECONNECT_HEALTHY_AFTER = 60
+
+# --- Scraper engine: "threaded" (socket thread + executor) or "async" ---
+SCRAPER_ENGINE = os.environ.get("SCRAPER_ENGINE", "threaded").lower()
+ASYNC_NOTIFY_CONCURRENCY = 4
+ASYNC_DOWNLOAD_CONCURRENCY = 10
+
+# --- Call event queue (socket thread -> consumer thread) ---
+EVENT_QUEUE_MAXSIZE = 256
+
+# --- Call state bounds: hard cap (LRU eviction) and expiry for unseen calls ---
+CALL_STATE_MAX_RECORDS = 10000
+CALL_STATE_TTL = 6 * 3600
+
+# --- Shared recording download pool (one per cookie) ---
+DOWNLOAD_POOL_SIZE = 10
+
+# --- Recording relay (True: stream to Telegram, False: save to disk first) ---
+STREAM_RECORDINGS = True
+STREAM_SPOOL_MEMORY_BYTES = 8 * 1024 * 1024   # Spill to a temp file above this
+STREAM_MAX_BYTES = 50 * 1024 * 1024           # Telegram Bot API upload limit
+RECORDING_CHUNK_SIZE = 64 * 1024
+
+# --- Optional WAV -> MP3 re-encode before upload (needs ffmpeg on PATH) ---
+TRANSCODE_WAV = os.environ.get("TRANSCODE_WAV", "0") == "1"
+TRANSCODE_BITRATE = os.environ.get("TRANSCODE_BITRATE", "48k")
+TRANSCODE_WORKERS = 2
+
+# --- Telegram delivery scheduler (groups allow ~20 messages/minute) ---
+TELEGRAM_RATE_PER_MINUTE = 20
+TELEGRAM_BURST = 3
+DELIVERY_WORKERS = 3
+DELIVERY_MAX_ATTEMPTS = 5
+DELIVERY_MAX_QUEUED_MESSAGES = 500
+# Each queued upload may hold a spooled recording (up to 8 MiB in RAM);
+# download workers wait for room instead of buffering more.
+DELIVERY_MAX_QUEUED_AUDIO = 16
+TELEGRAM_MESSAGE_LIMIT = 4000
+
+# --- Skip recordings already delivered (by uuid+did and by content hash) ---
+IDEMPOTENT_DELIVERY = True
+DELIVERED_INDEX_FILE = 'delivered.db'
+DELIVERED_INDEX_MAX_ENTRIES = 100000
+DELIVERED_CONTENT_WINDOW = 3600   # seconds; same number + same bytes within it = replay
+
+# --- "Call detected" aggregation window (0 = one message per call) ---
+NOTIFY_BATCH_WINDOW_MS = 1500
+# Share of TELEGRAM_RATE_PER_MINUTE the notifications may use; the window
+# is stretched to fit it (20/min and 0.5 -> at most one batch per 6 s),
+# leaving the rest of the bucket to audio uploads during a burst.
+NOTIFY_MAX_RATE_SHARE = 0.5
+
+# --- Durable "call ended -> download -> upload" jobs (threaded engine) ---
+DURABLE_JOBS = True
+JOBS_DB_FILE = 'jobs.db'
+JOB_WORKERS = 10
+JOB_MAX_ATTEMPTS = 3
+
+# --- Sharded mode: one scraper process per account in this file (None = off) ---
+ACCOUNTS_FILE = os.environ.get("ACCOUNTS_FILE")
+SHARD_HEARTBEAT_INTERVAL = 10
+SHARD_HEALTH_TIMEOUT = 60
+
+# --- Local metrics endpoint (Prometheus text format) ---
+METRICS_ENABLED = True
+METRICS_HOST = "0.0.0.0"
+METRICS_PORT = int(os.environ.get("PORT", "8080"))
+
 # --- Global variable to hold the scraper's socket client ---
 global_sio_client = None
 
-# ==========================================================
-# === AUTO-INSTALL LIBRARIES
-# ==========================================================
-def install():
-    """Installs required libraries."""
-    libs = ["requests", "socketio", "bs4", "pycountry", "python-telegram-bot"]
-    for m in libs:
-        try:
-            if m == "bs4":
-                __import__("bs4")
-            elif m == "pycountry":
-                __import__("pycountry")
-            elif m == "python-telegram-bot":
-                __import__("telegram")
-            else:
-                __import__(m)
-        except ImportError:
-            print(f"Installing {m}...")
-            if m == "socketio":
-                os.system(f"{sys.executable} -m pip install \"python-socketio[client]\"")
-            elif m == "bs4":
-                os.system(f"{sys.executable} -m pip install beautifulsoup4")
-            elif m == "pycountry":
-                os.system(f"{sys.executable} -m pip install pycountry")
-            elif m == "python-telegram-bot":
-                 os.system(f"{sys.executable} -m pip install python-telegram-bot")
-            else:
-                os.system(f"{sys.executable} -m pip install {m}")
+# --- Seconds from process start to the first connected socket (None = not yet) ---
+first_connect_seconds = None
+
+# --- Download pool the job workers should use right now ---
+current_download_client = None
+
+# --- Per-account download pools (sharded mode) ---
+download_clients = {}
+# Sharded mode: account name -> its CredentialProvider over ACCOUNTS_FILE
+account_credentials = {}
+
+# --- Opened on first download (see get_delivered_index) ---
+delivered_index = None
+_delivered_index_lock = threading.Lock()
+
+# --- token/user/cookie: updated in memory by the bot, creds.json is watched ---
+credentials = CredentialProvider(CREDS_FILE, FIXED_TOKEN, FIXED_USER, poll_interval=CREDS_POLL_INTERVAL)
+
+# --- Shared by every sender; worker threads start on first submit ---
+delivery = DeliveryScheduler(
+    rate_per_minute=TELEGRAM_RATE_PER_MINUTE,
+    burst=TELEGRAM_BURST,
+    workers=DELIVERY_WORKERS,
+    max_attempts=DELIVERY_MAX_ATTEMPTS,
+    max_queue=DELIVERY_MAX_QUEUED_MESSAGES,
+    max_audio_queue=DELIVERY_MAX_QUEUED_AUDIO
+)
+
+# --- Static media (thumbnail): bytes kept in memory ---
+media_cache = MediaCache()
+
+# --- WAV transcoder (None = off) ---
+transcoder = Transcoder(TRANSCODE_BITRATE, workers=TRANSCODE_WORKERS) if TRANSCODE_WAV else None
+
+# --- Hot-path metrics (served in Prometheus format at /metrics) ---
+CALL_EVENT_SECONDS = registry.histogram("scraper_call_event_seconds", "Time spent applying one call frame")
+CALL_EVENT_ERRORS = registry.counter("scraper_call_event_errors_total", "Call frames that raised while being applied")
+CALL_TRANSITIONS = registry.counter("scraper_call_transitions_total", "Call state transitions by kind")
+DOWNLOAD_SECONDS = registry.histogram("scraper_download_seconds", "Recording download (until handed to delivery)")
+DOWNLOAD_SIZE = registry.histogram("scraper_download_size_bytes", "Recording size", SIZE_BUCKETS)
+DOWNLOAD_BYTES = registry.counter("scraper_download_bytes_total", "Recording bytes downloaded")
+DOWNLOADS = registry.counter("scraper_downloads_total", "Recording downloads by result")
+TELEGRAM_SECONDS = registry.histogram("telegram_request_seconds", "Bot API request latency by method")
+TELEGRAM_REQUESTS = registry.counter("telegram_requests_total", "Bot API requests by method and HTTP status")
+TRANSCODE_SECONDS = registry.histogram("scraper_transcode_seconds", "Latency added by WAV transcoding")
+TRANSCODE_BYTES_SAVED = registry.counter("scraper_transcode_bytes_saved_total", "Upload bytes saved by transcoding")
+TRANSCODES = registry.counter("scraper_transcodes_total", "WAV transcode attempts by result")
+SOCKET_CONNECTS = registry.counter("scraper_socket_connects_total", "Successful Socket.IO connections")
+SOCKET_RECONNECTS = registry.counter("scraper_socket_reconnects_total", "Socket.IO reconnect attempts")
+
+# --- Loggers (configured by setup_logging(): LOG_LEVEL, LOG_FORMAT) ---
+log = logging.getLogger("scraper")
+bot_log = logging.getLogger("bot")
 
 # ==========================================================
 # === SCRAPER FUNCTIONS
 # ==========================================================
 
 def get_flag_emoji(country_name):
-    """Generates a flag emoji from a country name."""
-    try:
-        country = pycountry.countries.search_fuzzy(country_name)[0]
-        code = country.alpha_2
-        return "".join(chr(0x1F1E6 + ord(char) - ord('A')) for char in code)
-    except:
-        return "🌍"
-
-def load_credentials():
-    """Loads only the cookie from creds.json and combines with fixed token/user."""
-    print("[Scraper] Loading credentials from creds.json...")
-    if not os.path.exists(CREDS_FILE):
-        print(f"[Scraper] Error: `{CREDS_FILE}` not found.")
-        print("[Scraper] Please send the /update command to the bot to create it.")
-        return None, None, None
-        
-    try:
-        with open(CREDS_FILE, 'r') as f:
-            creds = json.load(f)
-        
-        # Load the cookie from file
-        cookie = creds.get('MANUAL_COOKIE_STRING')
-        
-        if not cookie:
-            print("[Scraper] Error: `creds.json` is missing cookie. Please run /update on the bot again.")
-            return None, None, None
-            
-        print("[Scraper] Credentials loaded successfully.")
-        # Return the FIXED token/user and the loaded cookie
-        return FIXED_TOKEN, FIXED_USER, cookie
-        
-    except Exception as e:
-        print(f"[Scraper] Error reading `{CREDS_FILE}`: {e}")
-        return None, None, None
+    """Generates a flag emoji from a country name (cached index lookup)."""
+    return country_index.flag_for(country_name)
 
 def get_country_name(termination_string):
     """Extracts the country name from a termination string."""
-    try:
-        parts = str(termination_string).split()
-        country_parts = []
-        for part in parts:
-            if part.lower() == 'mobile' or part.isdigit():
-                break
-            country_parts.append(part.upper())
-        
-        country = ' '.join(country_parts)
-        return country if country else "UNKNOWN"
-    except:
-        return "UNKNOWN"
+    return country_name_from_termination(termination_string)
 
 def mask_number(num):
     """Masks a number like '8551****649'."""
@@ -136,124 +216,362 @@ def mask_number(num):
     except:
         return num
 
-def send_telegram_message(text_message):
-    """Sends a plain text message to Telegram."""
+def telegram_post(method, timeout=30, **kwargs):
+    """One Bot API request, timed and counted per method/status."""
+    started = time.perf_counter()
     try:
-        payload = {
-            'chat_id': TELEGRAM_CHAT_ID_STR, # Use string version
-            'text': text_message,
-            'parse_mode': 'HTML'
-        }
         r = requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-            data=payload,
-            timeout=10
+            f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}",
+            timeout=timeout,
+            **kwargs
         )
-        if not r.ok:
-            print(f"[Scraper] TG Message Failed: {r.text}")
-    except Exception as e:
-        print(f"[Scraper] TG Message Error: {e}")
+    except Exception:
+        TELEGRAM_REQUESTS.inc(method=method, status="error")
+        raise
+    finally:
+        TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=method)
+    TELEGRAM_REQUESTS.inc(method=method, status=str(r.status_code))
+    return r
 
-def send_telegram_audio(file, num, country, duration_str):
-    """Sends the audio file with the new caption format and thumbnail."""
-    audio_f = None
-    thumb_f = None
-    try:
-        masked = mask_number(num)
-        local_time = datetime.datetime.now().strftime('%I:%M:%S %p')
-        flag = get_flag_emoji(country)
-        
-        caption = f"""🔥 NEW CALL {country} {flag} RECEIVED ✨
+def post_telegram_message(text_message):
+    """Posts a plain text message to Telegram and returns the response."""
+    payload = {
+        'chat_id': TELEGRAM_CHAT_ID_STR, # Use string version
+        'text': text_message,
+        'parse_mode': 'HTML'
+    }
+    return telegram_post("sendMessage", data=payload, timeout=10)
+
+def deliver_telegram_message(text_message, on_result=None):
+    """Queues a message on the delivery scheduler's priority lane."""
+    delivery.submit_message("sendMessage", lambda: post_telegram_message(text_message), on_result=on_result)
+
+def notify_batch_window_ms():
+    """NOTIFY_BATCH_WINDOW_MS, stretched so batches stay within NOTIFY_MAX_RATE_SHARE."""
+    return max(NOTIFY_BATCH_WINDOW_MS, 60000 / (TELEGRAM_RATE_PER_MINUTE * NOTIFY_MAX_RATE_SHARE))
+
+def telegram_len(text):
+    """Length as Telegram counts it (UTF-16 code units, so emoji count twice)."""
+    return len(text.encode("utf-16-le")) // 2
+
+def format_detection_message(item):
+    """Text for a single "call detected" notification."""
+    country, flag, did = item
+    masked_num = mask_number(did)
+    return f"🔥 NEW CALL {country} {flag} DETECTED ✨\n📞 Number: {masked_num}\n⏳ Waiting for Call 📞"
+
+def format_detection_batch(items):
+    """
+    One combined notification for a burst of detections, grouped by
+    country. Split into several messages (a large country group across
+    them too) if it would exceed Telegram's 4096-character limit.
+    """
+    by_country = {}
+    for country, flag, did in items:
+        by_country.setdefault((country, flag), []).append(mask_number(did))
+
+    header = f"🔥 {len(items)} NEW CALLS DETECTED ✨"
+    footer = "⏳ Waiting for Calls 📞"
+    budget = TELEGRAM_MESSAGE_LIMIT - telegram_len(footer) - 1
+
+    messages = []
+    current = [header]
+    used = telegram_len(header)
+    for (country, flag), numbers in sorted(by_country.items(), key=lambda kv: -len(kv[1])):
+        prefix = f"{flag} {country} ({len(numbers)}):"
+        line, line_used = prefix, telegram_len(prefix)
+        for number in numbers:
+            entry = f"{',' if line != prefix else ''} 📞 {number}"
+            entry_used = telegram_len(entry)
+            if used + 1 + line_used + entry_used > budget:
+                if line != prefix:
+                    current.append(line)
+                messages.append("\n".join(current))
+                current = [header + " (cont.)"]
+                used = telegram_len(current[0])
+                line, line_used = prefix, telegram_len(prefix)
+                entry = f" 📞 {number}"
+                entry_used = telegram_len(entry)
+            line += entry
+            line_used += entry_used
+        current.append(line)
+        used += 1 + line_used
+    current.append(footer)
+    messages.append("\n".join(current))
+    return messages
+
+def build_audio_caption(num, country):
+    """Caption used for every delivered recording."""
+    masked = mask_number(num)
+    local_time = datetime.datetime.now().strftime('%I:%M:%S %p')
+    flag = get_flag_emoji(country)
+
+    return f"""🔥 NEW CALL {country} {flag} RECEIVED ✨
 🌍 Country: {country} {flag}
 📞 Number: {masked}
 ⏰ Time: {local_time}
 """
-        
-        file_title = os.path.basename(file) 
-        
-        try:
-            duration_int = int(duration_str)
-        except:
-            duration_int = 0
-        
-        data = {
-            "chat_id": TELEGRAM_CHAT_ID_STR, # Use string version
-            "caption": caption,
-            "title": file_title,
-            "duration": duration_int
-        }
-        
-        files_payload = {}
-        audio_f = open(file, "rb")
-        files_payload["audio"] = audio_f
-        
-        try:
-            thumb_f = open("thumbnail.png", "rb") 
-            files_payload["thumbnail"] = thumb_f
-            print("[Scraper] Attaching thumbnail.png...")
-        except FileNotFoundError:
-            print("[Scraper] thumbnail.png not found, sending audio without it.")
-        except Exception as e:
-            print(f"[Scraper] Error attaching thumbnail: {e}")
 
-        r = requests.post(
-            f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio",
-            data=data,
-            files=files_payload,
-            timeout=30
-        )
-        print("[Scraper] Telegram: Audio Sent" if r.ok else f"TG Audio Failed: {r.text}")
+def build_audio_payload(file, num, country, duration_str, file_title=None):
+    """Form fields for sendAudio."""
+    if not file_title:
+        file_title = os.path.basename(file) if isinstance(file, str) else "recording.mp3"
 
-    except Exception as e:
-        print("[Scraper] TG Audio Error:", e)
-    finally:
-        if audio_f:
-            audio_f.close()
-        if thumb_f:
-            thumb_f.close()
+    return {
+        "chat_id": TELEGRAM_CHAT_ID_STR, # Use string version
+        "caption": build_audio_caption(num, country),
+        "title": file_title,
+        "duration": parse_duration(duration_str)
+    }
+
+def open_audio(file):
+    """`file` is either a path on disk or an open buffer from the streaming relay."""
+    return open(file, "rb") if isinstance(file, str) else file
+
+def cleanup_audio(file, audio_f):
+    """Closes the audio and deletes it if it was a file on disk."""
+    if audio_f:
+        audio_f.close()
+    if isinstance(file, str):
         try: 
             os.remove(file)
         except: 
             pass
 
-def download(url, cli, dur, country, cookie_jar):
+def post_telegram_audio(audio_f, data):
+    """One sendAudio attempt. Rewinds the audio first so it can be retried."""
+    audio_f.seek(0)
+    files_payload = {"audio": (data["title"], audio_f)}
+
+    # Read from disk once; the Bot API does not accept a file_id for thumbnails.
+    thumbnail = media_cache.asset_bytes(THUMBNAIL_FILE)
+    if thumbnail is not None:
+        files_payload["thumbnail"] = (os.path.basename(THUMBNAIL_FILE), thumbnail)
+
+    return telegram_post("sendAudio", data=data, files=files_payload)
+
+def deliver_telegram_audio(file, num, country, duration_str, file_title=None, on_result=None):
+    """
+    Queues the upload on the scheduler's audio lane. The audio stays open
+    across retries and is closed/deleted once delivered or dropped, then
+    on_result(delivered) is called.
+    """
+    audio_f = None
     try:
-        s = requests.Session()
-        s.cookies.update(cookie_jar)
-        
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36",
-            "Referer": "https://www.orangecarrier.com/live/calls",
-            "accept": "*/*",
-            "accept-language": "en-US,en;q:0.9",
-            "range": "bytes:0-",
-            "sec-fetch-dest": "audio",
-            "sec-fetch-mode": "no-cors",
-            "sec-fetch-site": "same-origin",
-        }
-        s.headers.update(headers)
+        data = build_audio_payload(file, num, country, duration_str, file_title)
+        audio_f = open_audio(file)
+    except Exception as e:
+        log.error("TG Audio Error: %s", e, extra={"did": num, "country": country})
+        cleanup_audio(file, audio_f)
+        return False
+
+    return delivery.submit_audio(
+        f"sendAudio {data['title']}",
+        lambda: post_telegram_audio(audio_f, data),
+        lambda: cleanup_audio(file, audio_f),
+        on_result
+    )
+
+def recording_extension(content_type):
+    """Picks a file extension from the recording's Content-Type."""
+    if 'wav' in content_type: return ".wav"
+    elif 'ogg' in content_type: return ".ogg"
+    elif 'html' in content_type: return ".html"
+    return ".mp3"
+
+def spool_recording(r):
+    """
+    Copies a streaming response into a SpooledTemporaryFile: it stays in
+    memory up to STREAM_SPOOL_MEMORY_BYTES and only spills to a temp file
+    above that. Aborts past STREAM_MAX_BYTES (Telegram's upload limit).
+    Returns (buffer, size, content hash), hashed as the chunks arrive.
+    """
+    buf = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MEMORY_BYTES, prefix="rec_")
+    hasher = content_hasher()
+    size = 0
+    try:
+        for c in r.iter_content(RECORDING_CHUNK_SIZE):
+            size += len(c)
+            if size > STREAM_MAX_BYTES:
+                raise ValueError(f"recording exceeds {STREAM_MAX_BYTES} bytes")
+            buf.write(c)
+            hasher.update(c)
+    except:
+        buf.close()
+        raise
+    buf.seek(0)
+    return buf, size, hasher.hexdigest()
+
+def get_delivered_index():
+    """The process's DeliveredIndex, opened on first use (None if disabled)."""
+    global delivered_index
+    if delivered_index is None and IDEMPOTENT_DELIVERY:
+        with _delivered_index_lock:
+            if delivered_index is None:
+                delivered_index = DeliveredIndex(
+                    DELIVERED_INDEX_FILE,
+                    max_entries=DELIVERED_INDEX_MAX_ENTRIES,
+                    content_window=DELIVERED_CONTENT_WINDOW
+                )
+    return delivered_index
+
+def download(url, cli, dur, country, client, on_result=None, uuid=None):
+    """
+    Downloads the recording and queues its upload. Returns False if the
+    download failed; on_result(delivered) reports the upload outcome.
+    With a `uuid` the call is idempotent: a (uuid, did) or a recording
+    that was already delivered is skipped and reported as delivered.
+    """
+    started = time.perf_counter()
+    fields = {"uuid": uuid, "did": cli, "country": country}
+
+    claim = None
+    index = get_delivered_index() if uuid is not None else None
+    if index is not None:
+        claim = index.claim(uuid, cli, on_result)
+        if claim is None:
+            log.info("Recording already delivered (or in flight), skipping download", extra=fields)
+            DOWNLOADS.inc(result="duplicate")
+            if on_result is not None:
+                on_result(True)
+            return True
+        on_result = claim.on_result
+
+    # Backpressure: don't fetch another recording while uploads are behind.
+    delivery.wait_for_audio_room()
+    if STREAM_RECORDINGS:
+        ok = download_streaming(url, cli, dur, country, client, on_result, fields, claim)
+    else:
+        ok = download_to_file(url, cli, dur, country, client, on_result, fields, claim)
+    if not ok and claim is not None:
+        claim.abandon()
+    DOWNLOAD_SECONDS.observe(time.perf_counter() - started)
+    DOWNLOADS.inc(result="ok" if ok else "failed")
+    return ok
+
+def skip_duplicate_content(claim, digest, content_type, fields):
+    """True if this number's recording was just delivered under another call."""
+    if claim is None or not claim.duplicate_content(digest, audio='html' not in content_type):
+        return False
+    log.info("Same recording already delivered, skipping upload", extra=fields)
+    claim.on_result(True)
+    return True
+
+def maybe_transcode(f, size, title, fields=None):
+    """
+    With TRANSCODE_WAV on, re-encodes a WAV recording to MP3 and returns
+    (new buffer, new size, new title). Anything else, or a failed or
+    not-smaller encode, comes back unchanged.
+    """
+    if transcoder is None or not transcoder.available or not transcoder.wants(f):
+        return f, size, title
+
+    started = time.perf_counter()
+    try:
+        encoded = transcoder.transcode(f)
+    except Exception as e:
+        TRANSCODES.inc(result="failed")
+        log.warning("Transcode failed, sending the original: %s", e, extra=fields)
+        return f, size, title
+    elapsed = time.perf_counter() - started
+
+    if len(encoded) >= size:
+        TRANSCODES.inc(result="not_smaller")
+        return f, size, title
+    transcoder.record(size, len(encoded), elapsed)
+    TRANSCODE_SECONDS.observe(elapsed)
+    TRANSCODE_BYTES_SAVED.inc(size - len(encoded))
+    TRANSCODES.inc(result="ok")
+    log.debug("Transcoded %s: %d -> %d bytes in %.2fs", title, size, len(encoded), elapsed, extra=fields)
+
+    f.close()
+    return io.BytesIO(encoded), len(encoded), os.path.splitext(title)[0] + ".mp3"
+
+def download_streaming(url, cli, dur, country, client, on_result=None, fields=None, claim=None):
+    """Relays the recording to sendAudio without writing it to the CWD."""
+    try:
+        log.debug("Streaming audio for %s from %s", cli, url, extra=fields)
 
-        print(f"[Scraper] Downloading audio for {cli} from {url}")
+        with client.get(url) as r:
+            r.raise_for_status()
+            content_type = r.headers.get('Content-Type', 'audio/mpeg').lower()
+            title = f"rec_{cli}_{int(time.time())}{recording_extension(content_type)}"
+            buf, size, digest = spool_recording(r)
+        DOWNLOAD_BYTES.inc(size)
+        DOWNLOAD_SIZE.observe(size)
+        if skip_duplicate_content(claim, digest, content_type, fields):
+            buf.close()
+            return True
+        buf, size, title = maybe_transcode(buf, size, title, fields)
+
+        log.debug("Relaying %s (%d bytes, Content-Type: %s)", title, size, content_type, extra=fields)
+        return deliver_telegram_audio(buf, cli, country, dur, file_title=title, on_result=on_result)
+
+    except Exception as e:
+        log.warning("Download failed: %s", e, extra=fields)
+        return False
+
+def download_to_file(url, cli, dur, country, client, on_result=None, fields=None, claim=None):
+    """File-based fallback: saves rec_<cli>_<ts>.ext, uploads, deletes."""
+    fn = None
+    try:
+        log.debug("Downloading audio for %s from %s", cli, url, extra=fields)
         
-        with s.get(url, stream=True, timeout=30) as r:
+        with client.get(url) as r:
             r.raise_for_status()
             content_type = r.headers.get('Content-Type', 'audio/mpeg').lower()
-            extension = ".mp3"
-            if 'wav' in content_type: extension = ".wav"
-            elif 'ogg' in content_type: extension = ".ogg"
-            elif 'html' in content_type: extension = ".html"
+            extension = recording_extension(content_type)
 
             fn = f"rec_{cli}_{int(time.time())}{extension}"
-            print(f"[Scraper] Saving as: {fn} (Content-Type: {content_type})")
+            log.debug("Saving as: %s (Content-Type: %s)", fn, content_type, extra=fields)
             
+            size = 0
+            hasher = content_hasher()
             with open(fn, "wb") as f:
-                for c in r.iter_content(8192): 
+                for c in r.iter_content(RECORDING_CHUNK_SIZE): 
                     f.write(c)
+                    hasher.update(c)
+                    size += len(c)
+        DOWNLOAD_BYTES.inc(size)
+        DOWNLOAD_SIZE.observe(size)
+        if skip_duplicate_content(claim, hasher.hexdigest(), content_type, fields):
+            os.remove(fn)
+            return True
+        if transcoder is not None:
+            with open(fn, "rb") as f:
+                audio, size, new_fn = maybe_transcode(f, size, fn, fields)
+            if new_fn != fn:
+                with open(new_fn, "wb") as out:
+                    out.write(audio.getvalue())
+                os.remove(fn)
+                fn = new_fn
         
-        send_telegram_audio(fn, cli, country, dur)
+        return deliver_telegram_audio(fn, cli, country, dur, on_result=on_result)
         
     except Exception as e:
-        print(f"[Scraper] Download failed: {e}")
+        log.warning("Download failed: %s", e, extra=fields)
+        if fn:
+            try:
+                os.remove(fn)
+            except:
+                pass
+        return False
+
+def job_download_client(job):
+    """The job's account pool, else whichever is current; None until it is built."""
+    return download_clients.get(job.account) if job.account else current_download_client
+
+def download_client_ready(job):
+    """DownloadJobQueue `ready` gate: resumed jobs wait for their pool instead of failing."""
+    return job_download_client(job) is not None
+
+def run_download_job(job, on_uploaded):
+    """DownloadJobQueue worker entry."""
+    client = job_download_client(job)
+    if client is None:
+        log.warning("No download client yet for %s", job, extra=job.log_fields())
+        return False
+    return download(job.url, job.did, job.duration, job.country, client, on_uploaded, uuid=job.uuid)
 
 def parse_cookie_string_to_jar(cookie_string):
     cookie_jar = RequestsCookieJar()
@@ -272,104 +590,114 @@ def parse_cookie_string_to_jar(cookie_string):
     return cookie_jar
 
 class CallHandler:
-    def __init__(self, http_session, executor):
-        self.http_session = http_session
+    def __init__(self, download_client, executor, jobs=None):
+        self.download_client = download_client
         self.executor = executor
-        self.detected_uuids = set()
-        self.active_calls = {}
+        self.jobs = jobs
+        self.state = CallStateStore(max_records=CALL_STATE_MAX_RECORDS, ttl=CALL_STATE_TTL)
+        self.batcher = None
+        if NOTIFY_BATCH_WINDOW_MS > 0:
+            self.batcher = NotificationBatcher(
+                notify_batch_window_ms(),
+                self.submit_notification,
+                format_detection_message,
+                format_detection_batch
+            )
 
     def on_call_event(self, data):
+        started = time.perf_counter()
         try:
-            calls_data = data.get('calls', {})
-            page_list = calls_data.get('calls', [])
-            ended_calls_list = calls_data.get('end', []) 
-            all_current_uuids_on_page = set()
-
-            for call_list_on_page in page_list: 
-                
-                if isinstance(call_list_on_page, dict):
-                    call_iterable = call_list_on_page.values()
-                else:
-                    call_iterable = call_list_on_page
-
-                for call in call_iterable:
-                    uuid = call.get('uuid')
-                    if not uuid: continue
-                    
-                    all_current_uuids_on_page.add(uuid)
-                    status = call.get('status')
-                    
-                    try:
-                        duration = int(call.get('duration', '0'))
-                    except ValueError:
-                        duration = 0
-
-                    if (status == 'up' and uuid not in self.detected_uuids):
-                        self.detected_uuids.add(uuid)
-                        did = call.get('cid_num', 'Unknown')
-                        termination = call.get('termination', 'UNKNOWN')
-                        country = get_country_name(termination)
-                        
-                        self.active_calls[uuid] = {
-                            'did': did,
-                            'country': country,
-                            'duration': duration
-                        }
-                        
-                        masked_num = mask_number(did)
-                        flag = get_flag_emoji(country)
-                        print(f"[Scraper] --- New Call Detected (at {duration}s) ---")
-                        print(f"[Scraper]   CLI/DID: {did} | UUID: {uuid}")
-                        text_message = f"🔥 NEW CALL {country} {flag} DETECTED ✨\n📞 Number: {masked_num}\n⏳ Waiting for Call 📞"
-                        self.executor.submit(send_telegram_message, text_message)
-                    
-                    elif (status == 'up' and uuid in self.active_calls):
-                        self.active_calls[uuid]['duration'] = duration
-                        
-            if ended_calls_list:
-                for call_data in ended_calls_list:
-                    uuid = call_data.get('uuid')
-                    
-                    if uuid in self.active_calls:
-                        call_info = self.active_calls.pop(uuid)
-                        did = call_info['did']
-                        country = call_info['country']
-                        last_duration = str(call_data.get('duration', call_info['duration']))
-
-                        print(f"[Scraper] --- Call Ended. Submitting Download ---")
-                        print(f"[Scraper]   CLI/DID: {did} | UUID: {uuid} | Duration: {last_duration}")
-                        
-                        download_url = f"{BASE_URL}/live/calls/sound?did={did}&uuid={uuid}"
-                        
-                        self.executor.submit(
-                            download, 
-                            download_url, 
-                            did, 
-                            last_duration,
-                            country,
-                            self.http_session.cookies
-                        )
-                        
-                        if uuid in self.detected_uuids:
-                            self.detected_uuids.remove(uuid)
-
-            active_uuids_to_prune = set(self.active_calls.keys()) - all_current_uuids_on_page
-            for uuid in active_uuids_to_prune:
-                print(f"[Scraper] Pruning stale call (no 'end' event): {uuid}")
-                self.active_calls.pop(uuid)
-                if uuid in self.detected_uuids:
-                    self.detected_uuids.remove(uuid)
+            rows, ended = extract_frame(data)
+
+            transitions = self.state.apply_rows(rows, ended)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Frame: %d call(s), %d ended, %d transition(s)",
+                          len(rows), len(ended), len(transitions))
+            for kind, uuid, record in transitions:
+                if kind == UP:
+                    self.on_call_detected(uuid, record)
+                elif kind == ENDED and record.detected:
+                    self.on_call_ended(uuid, record)
+                elif kind == STALE and record.detected:
+                    log.info("Pruning stale call (no 'end' event)",
+                             extra={"uuid": uuid, "did": record.did, "country": record.country})
+                elif kind == EVICTED and record.detected:
+                    log.warning("Evicted detected call from call state (TTL/size cap)",
+                                extra={"uuid": uuid, "did": record.did, "country": record.country})
+
+            if transitions:
+                counts = {}
+                for t in transitions:
+                    counts[t.kind] = counts.get(t.kind, 0) + 1
+                for kind, n in counts.items():
+                    CALL_TRANSITIONS.inc(n, kind=kind)
 
         except Exception as e:
-            print(f"[Scraper] Error in on_call_event: {e}")
-            print(f"[Scraper] Data: {str(data)[:200]}...")
+            CALL_EVENT_ERRORS.inc()
+            log.exception("Error in on_call_event: %s | Data: %.200s...", e, data)
+        finally:
+            CALL_EVENT_SECONDS.observe(time.perf_counter() - started)
+
+    def on_call_detected(self, uuid, record):
+        did = record.did
+        record.country, record.flag = country_index.resolve(record.termination)
+
+        log.info("New call detected (at %ss)", record.duration,
+                 extra={"uuid": uuid, "did": did, "country": record.country})
+        if self.batcher is not None:
+            self.batcher.add(record.country, record.flag, did)
+        else:
+            self.submit_notification(format_detection_message((record.country, record.flag, did)))
+
+    def on_call_ended(self, uuid, record):
+        did = record.did
+        last_duration = str(record.duration)
+
+        log.info("Call ended (duration %ss), submitting download", last_duration,
+                 extra={"uuid": uuid, "did": did, "country": record.country})
+
+        download_url = f"{BASE_URL}/live/calls/sound?did={did}&uuid={uuid}"
+
+        self.submit_download(uuid, download_url, did, last_duration, record.country)
+
+    # --- Dispatch (threaded engine; the async engine overrides these) ---
+    def submit_notification(self, text_message, on_result=None):
+        deliver_telegram_message(text_message, on_result)
+
+    def submit_download(self, uuid, download_url, did, last_duration, country):
+        if self.jobs is not None:
+            self.jobs.enqueue(uuid, did, country, last_duration, download_url)
+            return
+        self.executor.submit(
+            download,
+            download_url,
+            did,
+            last_duration,
+            country,
+            self.download_client,
+            uuid=uuid
+        )
 
 # ==========================================================
 # === BOT FUNCTIONS (MODIFIED)
 # ==========================================================
 
 async def start_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Starts the credential update conversation."""
+    """Starts the credential update conversation (`/update <account>` in sharded mode)."""
+    if account_credentials:
+        account = context.args[0] if context.args else None
+        if account not in account_credentials:
+            await update.message.reply_text(
+                "This bot runs one scraper per account; say which one to update:\n"
+                + "\n".join(f"/update {name}" for name in account_credentials)
+            )
+            return ConversationHandler.END
+        context.user_data["account"] = account
+        await update.message.reply_text(
+            f"OK. Please paste the entire new `cookie` string for account {account}."
+        )
+        return GET_COOKIE
+
     await update.message.reply_text(
         "OK. Please paste the entire new `cookie` string."
     )
@@ -378,39 +706,31 @@ async def start_update(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 # (REMOVED get_token and get_user functions)
 
 async def get_cookie(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Saves the cookie and tells scraper to restart."""
-    global global_sio_client
-    
+    """Hands the cookie to the running scraper and saves it."""
     cookie_string = update.message.text.strip()
-    
-    creds = {
-        'MANUAL_TOKEN': FIXED_TOKEN,      # Save the hard-coded token
-        'MANUAL_USER': FIXED_USER,        # Save the hard-coded user
-        'MANUAL_COOKIE_STRING': cookie_string # Save the new cookie
-    }
-    
+    account = context.user_data.get("account")
+
     try:
-        with open(CREDS_FILE, 'w') as f:
-            json.dump(creds, f, indent=4)
-        
+        # Subscribers swap the cookie into the live download pool; the
+        # socket only reconnects if token/user changed, which they don't here.
+        # In sharded mode this rewrites the account's entry in ACCOUNTS_FILE,
+        # which the account's download pool and its shard both watch.
+        provider = account_credentials[account] if account else credentials
+        old, new = provider.update(cookie_string)
+        bot_log.info("Credentials updated successfully%s.", f" for account {account}" if account else "")
+
+        reconnect = old is not None and old.socket_auth != new.socket_auth
+        target = f"account {account}" if account else "the running scraper"
         await update.message.reply_text(
             "✅ **Success!** New cookie saved.\n\n"
-            "🔄 **Telling scraper to restart...**"
+            + (f"🔄 **Socket credentials changed, {target} is reconnecting.**" if reconnect
+               else f"🚀 **Applied to {target}, no restart needed.**")
         )
-        print(f"[{datetime.datetime.now()}] [Bot] Credentials updated successfully.")
-        
-        if global_sio_client and global_sio_client.connected:
-            print("[Bot] Scraper is connected. Sending disconnect signal...")
-            global_sio_client.disconnect()
-            await update.message.reply_text("🚀 Scraper signaled to restart.")
-        else:
-            print("[Bot] Scraper was not connected. It will load new creds on its next try.")
-            await update.message.reply_text("Scraper was not running, but will use new credentials on its next start.")
-        
+
     except Exception as e:
         await update.message.reply_text(f"❌ **Error!**\nCould not save credentials: {e}")
-        print(f"[Bot] Error saving credentials: {e}")
-        
+        bot_log.error("Error saving credentials: %s", e)
+
     context.user_data.clear()
     return ConversationHandler.END
 
@@ -424,64 +744,183 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 # === MAIN EXECUTION LOGIC
 # ==========================================================
 
-def run_scraper_loop():
+class ReconnectBackoff:
+    """
+    Exponential reconnect delay with jitter. Starts at RECONNECT_DELAY_MIN,
+    doubles per consecutive failure up to RECONNECT_DELAY_MAX, and resets
+    once a connection has stayed up for RECONNECT_HEALTHY_AFTER seconds.
+    """
+
+    def __init__(self, minimum=None, maximum=None, healthy_after=None):
+        self.minimum = RECONNECT_DELAY_MIN if minimum is None else minimum
+        self.maximum = RECONNECT_DELAY_MAX if maximum is None else maximum
+        self.healthy_after = RECONNECT_HEALTHY_AFTER if healthy_after is None else healthy_after
+        self.failures = 0
+        self.reconnects = 0
+        self.connected_at = None
+
+    def connected(self):
+        self.connected_at = time.monotonic()
+
+    def next_delay(self):
+        """Call after the socket went away; returns how long to wait."""
+        self.reconnects += 1
+        if self.connected_at is not None and time.monotonic() - self.connected_at >= self.healthy_after:
+            self.failures = 0
+        self.connected_at = None
+        delay = min(self.maximum, self.minimum * (2 ** self.failures))
+        self.failures += 1
+        return delay * random.uniform(0.5, 1.0)
+
+
+def note_first_connect():
+    """Records (once) how long the process took to get a live socket."""
+    global first_connect_seconds
+    if first_connect_seconds is None:
+        first_connect_seconds = time.monotonic() - PROCESS_STARTED
+        log.info("First socket connected %.2fs after process start", first_connect_seconds)
+
+
+def build_http_session(cookie_string):
+    """requests.Session carrying the scraper's cookie jar and User-Agent."""
+    http_session = requests.Session()
+    http_session.cookies = parse_cookie_string_to_jar(cookie_string)
+    http_session.headers.update({
+        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
+    })
+    return http_session
+
+
+def run_scraper_loop(handler=None):
     """
     This function runs the scraper in a continuous loop.
-    If it disconnects (or is forced to by the bot),
-    it will loop, reload credentials, and reconnect.
+    If it disconnects, it will loop and reconnect.
+
+    Only the socket is rebuilt per connection. The executor, job workers,
+    download pool and call state live for the whole process, so a brief
+    websocket drop neither re-announces calls that were already detected
+    nor loses the "ended" downloads. A new cookie is swapped into the live
+    download pool without touching the socket; only a token/user change
+    reconnects it.
+
+    `handler` replaces the default CallHandler: shards pass one that
+    forwards calls to the supervisor, and then no executor, job queue or
+    download pool is created here.
     """
-    global global_sio_client
+    global global_sio_client, current_download_client
+
+    download_client = None
+    sio = None
+    connected_auth = None
+    reauth = threading.Event()
+    backoff = ReconnectBackoff()
+
+    # --- Processing state: created once, survives reconnects ---
+    executor = None
+    job_queue = None
+    owns_downloads = handler is None
+    if owns_downloads:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+        if DURABLE_JOBS:
+            job_queue = DownloadJobQueue(
+                JOBS_DB_FILE,
+                process=run_download_job,
+                workers=JOB_WORKERS,
+                max_attempts=JOB_MAX_ATTEMPTS,
+                ready=download_client_ready
+            )
+            job_queue.start()
+        handler = CallHandler(None, executor, jobs=job_queue)
+
+    event_queue = CallEventQueue(handler.on_call_event, maxsize=EVENT_QUEUE_MAXSIZE)
+    event_queue.start()
+
+    def collect_scraper_metrics():
+        yield ("scraper_tracked_calls", None, len(handler.state))
+        yield ("scraper_active_calls", None, handler.state.detected_count)
+        yield ("scraper_call_state_expired", None, handler.state.expired)
+        yield ("scraper_call_state_evicted", None, handler.state.evicted)
+        if executor is not None:
+            yield ("scraper_executor_queue_depth", None, executor._work_queue.qsize())
+        for key, value in event_queue.stats().items():
+            yield (f"scraper_event_queue_{key}", None, value)
+        if handler.batcher is not None:
+            for key, value in handler.batcher.stats().items():
+                yield (f"scraper_notify_batch_{key}", None, value)
+        if job_queue is not None:
+            for key, value in job_queue.stats().items():
+                yield (f"scraper_jobs_{key}", None, value)
+        if current_download_client is not None:
+            pool = current_download_client.pool_stats()
+            for key in ("downloads", "connections", "requests", "reused"):
+                yield (f"scraper_download_pool_{key}", None, pool[key])
+
+    registry.register_collector("scraper", collect_scraper_metrics)
+
+    on_call_frame = event_queue.put
+    if CAPTURE_FRAMES_FILE:
+        log.info("Capturing raw call frames to %s", CAPTURE_FRAMES_FILE)
+        on_call_frame = FrameRecorder(CAPTURE_FRAMES_FILE).wrap(event_queue.put)
+
+    def on_credentials_changed(old, new):
+        # Cookie: swap it into the live pool; running downloads are untouched.
+        if download_client is not None and (old is None or new.cookie != old.cookie):
+            download_client.swap_cookies(parse_cookie_string_to_jar(new.cookie))
+            log.info("Cookie swapped into the live download pool.")
+        # Token/user: the only thing that needs a new socket.
+        if sio is not None and connected_auth is not None and new.socket_auth != connected_auth:
+            log.info("Socket credentials changed, reconnecting.")
+            reauth.set()
+            sio.disconnect()
+
+    credentials.subscribe(on_credentials_changed)
 
     while True:
-        MANUAL_TOKEN, MANUAL_USER, MANUAL_COOKIE_STRING = load_credentials()
-        
-        if not MANUAL_TOKEN:
-            print("[Scraper] Credentials not found. Waiting 30 seconds...")
-            time.sleep(30)
-            continue
+        creds = credentials.wait()
 
-        print("[Scraper] Using provided credentials.")
-        
         query_params_dict = {
-            "token": MANUAL_TOKEN,
-            "user": MANUAL_USER,
+            "token": creds.token,
+            "user": creds.user,
             "EIO": 3, 
         }
         
         full_socket_url = f"{SOCKET_URL}?{urlencode(query_params_dict)}"
         
-        http_session = requests.Session()
-        http_session.cookies = parse_cookie_string_to_jar(MANUAL_COOKIE_STRING)
-        http_session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
-        })
-        
-        print("[Scraper] Session and tokens loaded.")
+        # Built once; later cookies are swapped in by on_credentials_changed.
+        if owns_downloads and download_client is None:
+            with build_http_session(credentials.current().cookie) as http_session:
+                download_client = DownloadClient.from_session(http_session, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            current_download_client = download_client
+            handler.download_client = download_client
 
-        executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
-        handler = CallHandler(http_session, executor)
-        
-        sio = socketio.Client(reconnection_attempts=10, reconnection_delay=5)
+        log.debug("Session and tokens loaded.")
+
+        # Reconnect policy lives in ReconnectBackoff, not in the client.
+        sio = socketio.Client(reconnection=False, json=socket_json)
+        connected_auth = creds.socket_auth
         global_sio_client = sio 
         
         @sio.event
         def connect():
-            print(f"\n[Scraper] Successfully connected!")
+            backoff.connected()
+            SOCKET_CONNECTS.inc()
+            note_first_connect()
+            log.info("Successfully connected!")
 
         @sio.event
         def connect_error(data):
-            print(f"[Scraper] Connection failed: {data}")
-            print("[Scraper] This may be due to an expired or invalid TOKEN, USER, or COOKIE.")
+            log.error("Connection failed: %s (expired or invalid TOKEN, USER, or COOKIE?)", data)
 
         @sio.event
         def disconnect():
-            print("[Scraper] Disconnected from WebSocket.")
+            log.warning("Disconnected from WebSocket.")
 
-        sio.on('call', handler.on_call_event)
+        # The socket thread only enqueues; the consumer applies the frame.
+        sio.on('call', on_call_frame)
 
         # --- Connect and Wait ---
         try:
-            print(f"[Scraper] Connecting to {SOCKET_URL}...")
+            log.info("Connecting to %s...", SOCKET_URL)
             sio.connect(
                 full_socket_url,
                 transports=['websocket']
@@ -489,31 +928,516 @@ def run_scraper_loop():
             sio.wait() 
             
         except socketio.exceptions.ConnectionError as e:
-            print(f"[Scraper] Failed to connect: {e}")
+            log.error("Failed to connect: %s", e)
         except Exception as e:
-            print(f"[Scraper] An error occurred: {e}")
+            log.exception("An error occurred: %s", e)
         finally:
-            print("[Scraper] Cleaning up session...")
-            executor.shutdown(wait=False)
-            http_session.close()
             global_sio_client = None # Clear the global client
-            print("[Scraper] Loop restarting in 5 seconds...")
-            time.sleep(5) # Wait before retrying
+            log.info("Event queue stats: %s", event_queue.stats())
+            if download_client is not None:
+                log.info("Download pool stats: %s", download_client.pool_stats())
+            log.info("Delivery stats: %s", delivery.stats())
+            if job_queue is not None:
+                log.info("Job queue stats: %s", job_queue.stats())
+            SOCKET_RECONNECTS.inc()
+            if reauth.is_set():
+                # Planned reconnect with new token/user: no backoff.
+                reauth.clear()
+            else:
+                delay = backoff.next_delay()
+                log.info("Reconnecting in %.1f seconds (attempt %d)...", delay, backoff.failures)
+                time.sleep(delay)
+
+
+# ==========================================================
+# === SHARDED MODE (ONE SCRAPER PROCESS PER ACCOUNT)
+# ==========================================================
+# Set ACCOUNTS_FILE to a multi-account credentials file (format in
+# credentials.py). Each account gets a shard process that runs
+# run_scraper_loop() with a ShardCallHandler; detections and ended calls
+# come back over one queue, are de-duplicated by call UUID across shards,
+# and go through this process's batcher, job queue and delivery scheduler.
+
+class ShardCallHandler(CallHandler):
+    """Shard-side handler: calls are forwarded to the supervisor instead of Telegram."""
+
+    def __init__(self, account, message_queue):
+        super().__init__(None, None)
+        self.batcher = None  # batching happens once, in the supervisor
+        self.account = account
+        self.message_queue = message_queue
+
+    def on_call_detected(self, uuid, record):
+        record.country, record.flag = country_index.resolve(record.termination)
+        log.info("New call detected (at %ss)", record.duration,
+                 extra={"uuid": uuid, "did": record.did, "country": record.country})
+        self.message_queue.put(("detected", self.account, uuid, record.did, record.country, record.flag))
+
+    def submit_download(self, uuid, download_url, did, last_duration, country):
+        self.message_queue.put(("ended", self.account, uuid, did, last_duration, country, download_url))
+
+
+def run_shard(account, message_queue):
+    """Entry point of one shard process (started by ShardSupervisor)."""
+    global credentials
+    log_setup.setup_logging(context={"shard": account})
+    credentials = CredentialProvider(
+        ACCOUNTS_FILE, FIXED_TOKEN, FIXED_USER,
+        poll_interval=CREDS_POLL_INTERVAL, account=account
+    )
+
+    def heartbeat():
+        while True:
+            connected = bool(global_sio_client is not None and global_sio_client.connected)
+            message_queue.put(("heartbeat", account, os.getpid(), connected))
+            time.sleep(SHARD_HEARTBEAT_INTERVAL)
+
+    threading.Thread(target=heartbeat, name="shard-heartbeat", daemon=True).start()
+    run_scraper_loop(ShardCallHandler(account, message_queue))
+
+
+def dispatch_shard_message(message, batcher, job_queue):
+    """Supervisor side: a (de-duplicated) message from a shard."""
+    kind = message[0]
+    if kind == "detected":
+        _, account, uuid, did, country, flag = message
+        if batcher is not None:
+            batcher.add(country, flag, did)
+        else:
+            deliver_telegram_message(format_detection_message((country, flag, did)))
+    elif kind == "ended":
+        _, account, uuid, did, duration, country, url = message
+        log.info("Call ended (duration %ss), submitting download", duration,
+                 extra={"uuid": uuid, "did": did, "country": country, "shard": account})
+        job_queue.enqueue(uuid, did, country, duration, url, account=account)
+
+
+def watch_account_cookie(account):
+    """Keeps download_clients[account] built from, and in sync with, the account's cookie."""
+    def on_credentials_changed(old, new):
+        client = download_clients.get(account)
+        if client is None:
+            with build_http_session(new.cookie) as http_session:
+                download_clients[account] = DownloadClient.from_session(http_session, pool_maxsize=DOWNLOAD_POOL_SIZE)
+        elif old is None or new.cookie != old.cookie:
+            client.swap_cookies(parse_cookie_string_to_jar(new.cookie))
+
+    provider = CredentialProvider(
+        ACCOUNTS_FILE, FIXED_TOKEN, FIXED_USER,
+        poll_interval=CREDS_POLL_INTERVAL, account=account
+    )
+    provider.subscribe(on_credentials_changed)
+    account_credentials[account] = provider
+    return provider.start()
+
+
+def start_shard_supervisor():
+    """Sharded mode: shards watch the sockets, downloads and delivery happen here."""
+    accounts = account_names(ACCOUNTS_FILE)
+    for account in accounts:
+        watch_account_cookie(account)
+
+    # Always durable here: jobs carry their account, so a restart resumes
+    # them with the right cookie.
+    job_queue = DownloadJobQueue(
+        JOBS_DB_FILE,
+        process=run_download_job,
+        workers=JOB_WORKERS,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        ready=download_client_ready
+    )
+    job_queue.start()
+
+    batcher = None
+    if NOTIFY_BATCH_WINDOW_MS > 0:
+        batcher = NotificationBatcher(
+            notify_batch_window_ms(),
+            deliver_telegram_message,
+            format_detection_message,
+            format_detection_batch
+        )
+
+    supervisor = ShardSupervisor(
+        run_shard,
+        accounts,
+        on_message=lambda message: dispatch_shard_message(message, batcher, job_queue),
+        health_timeout=SHARD_HEALTH_TIMEOUT
+    ).start()
+
+    def collect_shard_metrics():
+        stats = supervisor.stats()
+        yield ("scraper_shard_messages", None, stats["messages"])
+        yield ("scraper_shard_duplicates_suppressed", None, stats["duplicates_suppressed"])
+        for account, shard in stats["shards"].items():
+            labels = {"account": account}
+            yield ("scraper_shard_alive", labels, int(shard["alive"]))
+            yield ("scraper_shard_connected", labels, int(shard["connected"]))
+            yield ("scraper_shard_restarts", labels, shard["restarts"])
+        for key, value in job_queue.stats().items():
+            yield (f"scraper_jobs_{key}", None, value)
+        for account, client in list(download_clients.items()):
+            pool = client.pool_stats()
+            for key in ("downloads", "connections", "requests", "reused"):
+                yield (f"scraper_download_pool_{key}", {"account": account}, pool[key])
+
+    registry.register_collector("shards", collect_shard_metrics)
+    return supervisor
+
+
+# ==========================================================
+# === ASYNC ENGINE (SCRAPER INSIDE THE BOT'S EVENT LOOP)
+# ==========================================================
+# Same CallHandler logic, but the socket is a socketio.AsyncClient and
+# notify/download/upload are coroutines on the bot's own loop, bounded by
+# semaphores instead of a ThreadPoolExecutor. Select it with
+# SCRAPER_ENGINE=async to benchmark it against the threaded engine.
+
+class ReusableUpload(io.RawIOBase):
+    """
+    Read-through view of a recording buffer for aiohttp, which closes the
+    file it streamed; closing this leaves the buffer open for a retry.
+    """
+
+    def __init__(self, buf):
+        super().__init__()
+        self.buf = buf
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.buf.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class AsyncCallHandler(CallHandler):
+    def __init__(self, download_session, telegram_session):
+        super().__init__(None, None)
+        self.loop = asyncio.get_running_loop()
+        self.download_session = download_session
+        self.telegram_session = telegram_session
+        self.notify_limit = asyncio.Semaphore(ASYNC_NOTIFY_CONCURRENCY)
+        self.download_limit = asyncio.Semaphore(ASYNC_DOWNLOAD_CONCURRENCY)
+        self.tasks = set()
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def submit_notification(self, text_message, on_result=None):
+        # The batcher's window timer calls this from its own thread.
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self.loop.call_soon_threadsafe(self._spawn, self.send_message(text_message, on_result))
+            return
+        self._spawn(self.send_message(text_message, on_result))
+
+    def submit_download(self, uuid, download_url, did, last_duration, country):
+        self._spawn(self.download(download_url, did, last_duration, country, uuid))
+
+    async def telegram_request(self, method, data):
+        """Async twin of telegram_post: (status, body text), timed and counted the same way."""
+        started = time.perf_counter()
+        try:
+            async with self.telegram_session.post(
+                f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}",
+                data=data
+            ) as r:
+                body = await r.text()
+        except Exception:
+            TELEGRAM_REQUESTS.inc(method=method, status="error")
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=method)
+        TELEGRAM_REQUESTS.inc(method=method, status=str(r.status))
+        return r.status, body
+
+    async def send_message(self, text_message, on_result=None):
+        """Through the shared delivery scheduler's bucket and retry policy."""
+        payload = {
+            'chat_id': TELEGRAM_CHAT_ID_STR,
+            'text': text_message,
+            'parse_mode': 'HTML'
+        }
+        async with self.notify_limit:
+            delivered = await delivery.deliver_async(
+                PRIORITY_MESSAGE, "sendMessage",
+                lambda: self.telegram_request("sendMessage", payload)
+            )
+        if on_result is not None:
+            on_result(delivered)
+
+    async def download(self, url, cli, dur, country, uuid=None):
+        fields = {"uuid": uuid, "did": cli, "country": country}
+        index = get_delivered_index() if uuid is not None else None
+        claim = index.claim(uuid, cli) if index is not None else None
+        if index is not None and claim is None:
+            log.info("Recording already delivered (or in flight), skipping download", extra=fields)
+            return
+        async with self.download_limit:
+            buf = None
+            delivered = False
+            try:
+                log.debug("Streaming audio for %s from %s", cli, url, extra=fields)
+                async with self.download_session.get(url) as r:
+                    r.raise_for_status()
+                    content_type = r.headers.get('Content-Type', 'audio/mpeg').lower()
+                    title = f"rec_{cli}_{int(time.time())}{recording_extension(content_type)}"
+
+                    buf = tempfile.SpooledTemporaryFile(max_size=STREAM_SPOOL_MEMORY_BYTES, prefix="rec_")
+                    hasher = content_hasher()
+                    size = 0
+                    async for c in r.content.iter_chunked(RECORDING_CHUNK_SIZE):
+                        size += len(c)
+                        if size > STREAM_MAX_BYTES:
+                            raise ValueError(f"recording exceeds {STREAM_MAX_BYTES} bytes")
+                        buf.write(c)
+                        hasher.update(c)
+                    buf.seek(0)
+
+                if skip_duplicate_content(claim, hasher.hexdigest(), content_type, fields):
+                    claim = None
+                    return
+                buf, size, title = await asyncio.to_thread(maybe_transcode, buf, size, title, fields)
+                log.debug("Relaying %s (%d bytes, Content-Type: %s)", title, size, content_type, extra=fields)
+                delivered = await self.send_audio(buf, cli, country, dur, title)
+            except Exception as e:
+                log.warning("Download failed: %s", e, extra=fields)
+            finally:
+                if buf is not None:
+                    buf.close()
+                if claim is not None:
+                    claim.on_result(delivered)
+
+    async def send_audio(self, buf, num, country, duration_str, title):
+        """Through the shared delivery scheduler; the form is rebuilt for every attempt."""
+        import aiohttp
+        caption = build_audio_caption(num, country)
+        thumbnail = media_cache.asset_bytes(THUMBNAIL_FILE)
+
+        def build_form():
+            buf.seek(0)
+            form = aiohttp.FormData()
+            form.add_field("chat_id", TELEGRAM_CHAT_ID_STR)
+            form.add_field("caption", caption)
+            form.add_field("title", title)
+            form.add_field("duration", str(parse_duration(duration_str)))
+            form.add_field("audio", ReusableUpload(buf), filename=title)
+            if thumbnail is not None:
+                form.add_field("thumbnail", thumbnail, filename=os.path.basename(THUMBNAIL_FILE))
+            return form
+
+        delivered = await delivery.deliver_async(
+            PRIORITY_AUDIO, f"sendAudio {title}",
+            lambda: self.telegram_request("sendAudio", build_form())
+        )
+        if delivered:
+            log.info("Telegram: Audio Sent", extra={"did": num, "country": country})
+        return delivered
+
+    async def drain(self, timeout=30):
+        """Waits for in-flight notifications/downloads before tearing down."""
+        if self.tasks:
+            await asyncio.wait(set(self.tasks), timeout=timeout)
+
+
+async def run_async_scraper_loop():
+    """
+    Async twin of run_scraper_loop, run as a task on the bot's loop.
+    As there, only the socket is rebuilt per connection; the handler, its
+    call state and the HTTP sessions persist across reconnects, and a new
+    cookie is swapped into the download session's headers in place.
+    """
+    global global_sio_client
+    import aiohttp  # only the async engine needs it; keeps threaded start-up lighter
+
+    loop = asyncio.get_running_loop()
+    backoff = ReconnectBackoff()
+    telegram_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+    download_session = None
+    sio = None
+    connected_auth = None
+    reauth = False
+
+    handler = AsyncCallHandler(None, telegram_session)
+    event_queue = AsyncCallEventQueue(handler.on_call_event, maxsize=EVENT_QUEUE_MAXSIZE)
+    event_queue.start()
+
+    def apply_credentials(old, new):
+        # Runs on the loop, so the header swap cannot interleave with a request.
+        nonlocal reauth
+        if download_session is not None and (old is None or new.cookie != old.cookie):
+            download_session.headers["Cookie"] = new.cookie
+            log.info("Cookie swapped into the live download session.")
+        if sio is not None and connected_auth is not None and new.socket_auth != connected_auth:
+            log.info("Socket credentials changed, reconnecting.")
+            reauth = True
+            handler._spawn(sio.disconnect())
+
+    def on_credentials_changed(old, new):
+        loop.call_soon_threadsafe(apply_credentials, old, new)
+
+    credentials.subscribe(on_credentials_changed)
+
+    try:
+        while True:
+            creds = credentials.current() or await asyncio.to_thread(credentials.wait, 5)
+            if creds is None:
+                continue
+
+            query_params_dict = {
+                "token": creds.token,
+                "user": creds.user,
+                "EIO": 3,
+            }
+            full_socket_url = f"{SOCKET_URL}?{urlencode(query_params_dict)}"
+
+            if download_session is None:
+                download_session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=DOWNLOAD_POOL_SIZE, keepalive_timeout=60),
+                    headers={**DOWNLOAD_HEADERS, "Cookie": creds.cookie},
+                    timeout=aiohttp.ClientTimeout(total=30),
+                )
+                handler.download_session = download_session
+
+            sio = socketio.AsyncClient(reconnection=False, json=socket_json)
+            connected_auth = creds.socket_auth
+            global_sio_client = sio
+
+            @sio.event
+            async def connect():
+                backoff.connected()
+                SOCKET_CONNECTS.inc()
+                note_first_connect()
+                log.info("Successfully connected! (async engine)")
+
+            @sio.event
+            async def connect_error(data):
+                log.error("Connection failed: %s (expired or invalid TOKEN, USER, or COOKIE?)", data)
+
+            @sio.event
+            async def disconnect():
+                log.warning("Disconnected from WebSocket.")
+
+            sio.on('call', event_queue.put)
+
+            try:
+                log.info("Connecting to %s...", SOCKET_URL)
+                await sio.connect(full_socket_url, transports=['websocket'])
+                await sio.wait()
+
+            except socketio.exceptions.ConnectionError as e:
+                log.error("Failed to connect: %s", e)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception("An error occurred: %s", e)
+            finally:
+                global_sio_client = None
+
+            log.info("Event queue stats: %s", event_queue.stats())
+            SOCKET_RECONNECTS.inc()
+            if reauth:
+                reauth = False
+                continue
+            delay = backoff.next_delay()
+            log.info("Reconnecting in %.1f seconds (attempt %d)...", delay, backoff.failures)
+            await asyncio.sleep(delay)
+    finally:
+        log.info("Shutting down async engine...")
+        credentials.unsubscribe(on_credentials_changed)
+        await event_queue.stop()
+        if handler.batcher is not None:
+            handler.batcher.flush()
+        await handler.drain()
+        if download_session is not None:
+            await download_session.close()
+        await telegram_session.close()
+
+
+def collect_shared_metrics():
+    """Gauges for process-wide components (delivery, caches)."""
+    stats = delivery.stats()
+    for lane, depth in stats["queue_depth"].items():
+        yield ("telegram_delivery_queue_depth", {"lane": lane}, depth)
+    yield ("telegram_delivery_in_flight", None, stats["in_flight"])
+    yield ("telegram_delivery_retries", None, stats["retries"])
+    yield ("telegram_delivery_rate_limited", None, stats["rate_limited"])
+    for lane in ("message", "audio"):
+        for key in ("submitted", "delivered", "dropped", "latency_p50", "latency_p95"):
+            yield (f"telegram_delivery_{key}", {"lane": lane}, stats[lane][key])
+    for key, value in country_index.stats().items():
+        yield (f"country_index_{key}", None, value)
+    for key, value in media_cache.stats().items():
+        yield (f"media_cache_{key}", None, value)
+    if delivered_index is not None:
+        for key, value in delivered_index.stats().items():
+            yield (f"delivered_index_{key}", None, value)
+    if transcoder is not None:
+        for key, value in transcoder.stats().items():
+            yield (f"transcode_{key}", None, value)
+    for key, value in credentials.stats().items():
+        yield (f"credentials_{key}", None, value)
+    for key, value in log_setup.stats().items():
+        yield (f"log_records_{key}", None, value)
+    if first_connect_seconds is not None:
+        yield ("scraper_startup_to_first_connect_seconds", None, round(first_connect_seconds, 3))
+
+
+def start_metrics_server():
+    """Serves combined_bot_web (/metrics, /healthz) from a daemon thread."""
+    from werkzeug.serving import make_server
+    from combined_bot_web import app
+
+    registry.register_collector("shared", collect_shared_metrics)
+    try:
+        server = make_server(METRICS_HOST, METRICS_PORT, app, threaded=True)
+    except OSError as e:
+        logging.getLogger("metrics").error("Could not bind %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.getLogger("metrics").info("Serving /metrics on %s:%s", METRICS_HOST, METRICS_PORT)
+    return server
+
+
+async def start_async_engine(application):
+    """post_init hook: runs the async scraper as a task of the bot's Application."""
+    log.info("Starting async scraper engine on the bot's event loop...")
+    application.create_task(run_async_scraper_loop())
 
 
 if __name__ == '__main__':
-    print("Running auto-installer...")
-    install()
-    print("Installer finished.")
+    log_setup.setup_logging()
+    log.info("Socket frames decoded with %s.", socket_json.name)
+    if transcoder is not None and not transcoder.available:
+        log.warning("TRANSCODE_WAV=1 but ffmpeg was not found on PATH; recordings are sent as served.")
+    # Dependencies are no longer installed at boot: run `python deps.py`.
+
+    if METRICS_ENABLED:
+        start_metrics_server()
+
+    builder = Application.builder().token(TELEGRAM_BOT_TOKEN)
 
-    # --- 6. START THE SCRAPER IN A BACKGROUND THREAD ---
-    print("Starting scraper thread...")
-    scraper_thread = threading.Thread(target=run_scraper_loop, daemon=True)
-    scraper_thread.start()
+    if SCRAPER_ENGINE == "async":
+        # --- 6. THE SCRAPER RUNS AS A TASK ON THE BOT'S LOOP ---
+        builder = builder.post_init(start_async_engine)
+    elif ACCOUNTS_FILE:
+        # --- 6. ONE SCRAPER PROCESS PER ACCOUNT, DELIVERY IN THIS ONE ---
+        log.info("Starting shard supervisor for %s...", ACCOUNTS_FILE)
+        start_shard_supervisor()
+    else:
+        # --- 6. START THE SCRAPER IN A BACKGROUND THREAD ---
+        log.info("Starting scraper thread...")
+        scraper_thread = threading.Thread(target=run_scraper_loop, daemon=True)
+        scraper_thread.start()
 
     # --- 7. START THE BOT IN THE MAIN THREAD ---
-    print("Starting Updater Bot in main thread...")
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    bot_log.info("Starting Updater Bot in main thread...")
+    application = builder.build()
 
     user_filter = filters.Chat(chat_id=TELEGRAM_CHAT_ID_INT) # Use integer ID
 
@@ -528,5 +1452,5 @@ if __name__ == '__main__':
 
     application.add_handler(conv_handler)
 
-    print(f"Bot is running. Send /update from chat ID {TELEGRAM_CHAT_ID_INT} to begin.")
+    bot_log.info("Bot is running. Send /update from chat ID %s to begin.", TELEGRAM_CHAT_ID_INT)
     application.run_polling()
@@ -0,0 +1,54 @@
+import time
+import threading
+
+# ==========================================================
+# === STATIC MEDIA CACHE (BYTES IN MEMORY)
+# ==========================================================
+# Static assets (thumbnail, logos, ...) are read from disk once and kept
+# in memory, so senders no longer open/stat the file on every call. A
+# missing asset is re-checked every MISSING_RECHECK_SECONDS, so one that
+# appears later is picked up without a restart.
+#
+# Only bytes are cached: the one asset sent today is sendAudio's
+# `thumbnail`, which the Bot API does not accept as a file_id
+# ("thumbnails can't be reused").
+
+MISSING_RECHECK_SECONDS = 60
+
+
+class MediaCache:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._assets = {}   # path -> (bytes or None, loaded_at)
+        self._lock = threading.Lock()
+
+        # --- Metrics ---
+        self.hits = 0
+        self.reads = 0
+
+    def asset_bytes(self, path):
+        """The asset's bytes, or None if it is missing."""
+        with self._lock:
+            cached = self._assets.get(path)
+            if cached is not None:
+                content, loaded_at = cached
+                if content is not None or self.clock() - loaded_at < MISSING_RECHECK_SECONDS:
+                    self.hits += 1
+                    return content
+            self.reads += 1
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                content = None
+            self._assets[path] = (content, self.clock())
+            return content
+
+    def stats(self):
+        with self._lock:
+            in_memory = sum(1 for (content, _) in self._assets.values() if content is not None)
+        return {
+            "hits": self.hits,
+            "reads": self.reads,
+            "assets_in_memory": in_memory,
+        }
@@ -0,0 +1,127 @@
+import logging
+import threading
+
+log = logging.getLogger("scraper")
+
+# ==========================================================
+# === "CALL DETECTED" NOTIFICATION BATCHER
+# ==========================================================
+# Leading-edge aggregation window: a detection that arrives while no
+# window is open is sent at once and opens a window of `window_ms`.
+# Detections arriving inside the window are collected and sent as one
+# combined message when it closes, and the window is reopened in case the
+# burst continues. A window that collects nothing simply closes.
+#
+# A batch is only sent once the previous one has left the delivery
+# scheduler (sent or dropped). Until then detections keep merging into
+# the pending batch, so a burst never builds a backlog of stale texts
+# in the message lane: at most one window's worth of messages is queued
+# at a time, and the window bounds how much of the Telegram rate the
+# notifications can take from audio uploads.
+
+
+class NotificationBatcher:
+    def __init__(self, window_ms, send, render_single, render_batch):
+        """
+        send(text, on_result)   -> queues one Telegram message; calls
+                                   on_result(delivered) once it was sent
+                                   or dropped
+        render_single(item)     -> text for one detection
+        render_batch(items)     -> list of texts for several detections
+        Items are (country, flag, did) tuples.
+        """
+        self.window = window_ms / 1000.0
+        self.send = send
+        self.render_single = render_single
+        self.render_batch = render_batch
+        self._pending = []
+        self._window_open = False
+        self._window_elapsed = False
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        # --- Metrics ---
+        self.detections = 0
+        self.messages_sent = 0
+        self.batches_sent = 0
+        self.held = 0
+
+    def add(self, country, flag, did):
+        item = (country, flag, did)
+        with self._lock:
+            self.detections += 1
+            if self._window_open:
+                self._pending.append(item)
+                return
+            self._window_open = True
+            self._window_elapsed = False
+            self._in_flight += 1
+        self._deliver([self.render_single(item)])
+        self._arm()
+
+    def _arm(self):
+        timer = threading.Timer(self.window, self._close_window)
+        timer.daemon = True
+        timer.start()
+
+    def _close_window(self):
+        with self._lock:
+            self._window_elapsed = True
+        self._send_pending()
+
+    def _sent(self, delivered):
+        with self._lock:
+            self._in_flight -= 1
+        self._send_pending()
+
+    def _send_pending(self):
+        """Sends the pending batch once the window closed and nothing is in flight."""
+        with self._lock:
+            if not self._window_elapsed:
+                return
+            if self._in_flight:
+                if self._pending:
+                    self.held += 1
+                return
+            items, self._pending = self._pending, []
+            if not items:
+                self._window_open = False
+                return
+            self._window_elapsed = False
+            texts = self._render(items)
+            self._in_flight += len(texts)
+        self._deliver(texts)
+        self._arm()
+
+    def _render(self, items):
+        if len(items) == 1:
+            return [self.render_single(items[0])]
+        self.batches_sent += 1
+        return self.render_batch(items)
+
+    def _deliver(self, texts):
+        for text in texts:
+            self.messages_sent += 1
+            try:
+                self.send(text, self._sent)
+            except Exception as e:
+                log.exception("Notification send error: %s", e)
+                self._sent(False)
+
+    def flush(self):
+        """Sends whatever is pending right away (used on shutdown)."""
+        with self._lock:
+            items, self._pending = self._pending, []
+            texts = self._render(items) if items else []
+            self._in_flight += len(texts)
+        self._deliver(texts)
+
+    def stats(self):
+        return {
+            "detections": self.detections,
+            "messages_sent": self.messages_sent,
+            "batches_sent": self.batches_sent,
+            "held": self.held,
+            "in_flight": self._in_flight,
+            "pending": len(self._pending),
+        }
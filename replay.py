@@ -0,0 +1,161 @@
+import json
+import time
+import random
+import logging
+import threading
+
+log = logging.getLogger("capture")
+
+# ==========================================================
+# === CALL FRAME CAPTURE / REPLAY
+# ==========================================================
+# Capture: every raw `call` frame is appended to a JSONL file as
+#   {"t": <unix time>, "data": <frame>}
+# Replay: captured (or synthetic) frames are fed to any callable, e.g.
+# CallHandler.on_call_event or CallEventQueue.put, at 1x, 10x or max speed.
+
+
+class FrameRecorder:
+    """Appends raw frames to a JSONL file. Cheap enough for the socket thread."""
+
+    def __init__(self, path, flush_every=50):
+        self.path = path
+        self.flush_every = flush_every
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8")
+
+    def record(self, data):
+        line = json.dumps({"t": time.time(), "data": data}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._f.write(line + "\n")
+            self.frames += 1
+            if self.frames % self.flush_every == 0:
+                self._f.flush()
+
+    def wrap(self, callback):
+        """Returns a socket callback that records the frame, then forwards it."""
+        def recorded(data):
+            try:
+                self.record(data)
+            except Exception as e:
+                log.warning("Could not record frame: %s", e)
+            return callback(data)
+        return recorded
+
+    def close(self):
+        with self._lock:
+            self._f.flush()
+            self._f.close()
+
+
+def load_frames(path):
+    """Yields (timestamp, frame) from a capture file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            yield entry.get("t", 0.0), entry["data"]
+
+
+def synthetic_did(i):
+    """Numbers whose masked form (first 4 + last 3 digits) is unique per call."""
+    return f"{1000 + (i // 1000) % 9000}555{i % 1000:03d}"
+
+
+SYNTHETIC_TERMINATIONS = [
+    "BANGLADESH MOBILE 88017",
+    "PAKISTAN MOBILE 9230",
+    "UNITED KINGDOM MOBILE 447",
+    "INDIA MOBILE 9198",
+    "NIGERIA MOBILE 23480",
+    "EGYPT MOBILE 2010",
+    "UNITED STATES 1202",
+    "RUSSIA MOBILE 79",
+]
+
+
+def synthetic_frames(calls=200, concurrency=20, ring_frames=2, up_frames=6,
+                     frame_interval=0.2, pages=2, seed=1):
+    """
+    Yields (timestamp, frame) for `calls` calls, at most `concurrency` live
+    at once. Each call rings for `ring_frames` frames, is 'up' for
+    `up_frames` frames (duration ticking), then shows up in `end`.
+    Live calls are spread over `pages` page lists, alternating list and
+    dict page shapes like the real feed.
+    """
+    rng = random.Random(seed)
+    live = []
+    started = 0
+    t = time.time()
+
+    while started < calls or live:
+        while started < calls and len(live) < concurrency:
+            live.append({
+                "uuid": f"bench-{started:06d}",
+                "cid_num": synthetic_did(started),
+                "termination": rng.choice(SYNTHETIC_TERMINATIONS),
+                "age": -rng.randint(0, 2),
+            })
+            started += 1
+
+        ended = []
+        page_lists = [[] for _ in range(pages)]
+        still_live = []
+        for n, call in enumerate(live):
+            call["age"] += 1
+            age = call["age"]
+            if age <= 0:
+                still_live.append(call)
+                continue
+            if age > ring_frames + up_frames:
+                ended.append({"uuid": call["uuid"], "duration": str(up_frames)})
+                continue
+            status = "ringing" if age <= ring_frames else "up"
+            duration = max(0, age - ring_frames)
+            page_lists[n % pages].append({
+                "uuid": call["uuid"],
+                "status": status,
+                "duration": str(duration),
+                "cid_num": call["cid_num"],
+                "termination": call["termination"],
+            })
+            still_live.append(call)
+        live = still_live
+
+        page_payload = [
+            {str(i): c for i, c in enumerate(page)} if p % 2 else page
+            for p, page in enumerate(page_lists)
+        ]
+        yield t, {"calls": {"calls": page_payload, "end": ended}}
+        t += frame_interval
+
+
+def replay(frames, deliver, speed=1.0, on_frame=None):
+    """
+    Feeds (timestamp, frame) pairs to deliver(frame). speed=1 keeps the
+    original gaps, speed=10 plays ten times faster, speed=0 (or None)
+    plays as fast as possible. on_frame(frame) runs right before each
+    delivery (used by benchmarks to timestamp events).
+    Returns (frames_delivered, elapsed_seconds).
+    """
+    count = 0
+    started = time.monotonic()
+    first_t = None
+
+    for t, frame in frames:
+        if speed:
+            if first_t is None:
+                first_t = t
+            target = started + (t - first_t) / speed
+            delay = target - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        if on_frame is not None:
+            on_frame(frame)
+        deliver(frame)
+        count += 1
+
+    return count, time.monotonic() - started
@@ -0,0 +1,197 @@
+import time
+import queue
+import random
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+
+log = logging.getLogger("shards")
+
+# ==========================================================
+# === MULTI-ACCOUNT SHARD SUPERVISOR
+# ==========================================================
+# One scraper process ("shard") per account in a multi-account
+# credentials file. Shards only hold the socket and the call state; they
+# put small tuples on one multiprocessing queue and the supervisor (the
+# bot process) turns them into notifications and download jobs, so all
+# accounts share a single delivery pipeline and Telegram rate limit.
+#
+# Messages on the queue (first two fields are always kind, account):
+#   ("heartbeat", account, pid, connected)
+#   anything else is passed to on_message() unless its (kind, uuid) was
+#   already seen from another shard; the uuid is always the third field.
+#
+# Health: a shard whose process died, or that sent no heartbeat for
+# `health_timeout` seconds, is killed and restarted with per-shard
+# exponential backoff.
+
+
+class UuidDeduper:
+    """Bounded "seen recently" set: LRU on insertion, entries expire after `ttl`."""
+
+    def __init__(self, max_entries=50000, ttl=6 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.suppressed = 0
+        self._seen = OrderedDict()
+
+    def first_time(self, key):
+        now = time.monotonic()
+        seen_at = self._seen.get(key)
+        if seen_at is not None and now - seen_at < self.ttl:
+            self.suppressed += 1
+            return False
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return True
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class Shard:
+    __slots__ = ("account", "process", "started_at", "last_heartbeat", "connected",
+                 "restarts", "failures", "next_start")
+
+    def __init__(self, account):
+        self.account = account
+        self.process = None
+        self.started_at = None
+        self.last_heartbeat = None
+        self.connected = False
+        self.restarts = 0
+        self.failures = 0
+        self.next_start = 0.0
+
+
+class ShardSupervisor:
+    def __init__(self, target, accounts, on_message, health_timeout=60, check_interval=5,
+                 restart_delay_min=1, restart_delay_max=60, healthy_after=60):
+        """
+        target(account, message_queue) -> runs one shard (in a child process,
+            must be importable by multiprocessing's spawn start method)
+        on_message(message)             -> called on the supervisor's thread
+        """
+        self.target = target
+        self.on_message = on_message
+        self.health_timeout = health_timeout
+        self.check_interval = check_interval
+        self.restart_delay_min = restart_delay_min
+        self.restart_delay_max = restart_delay_max
+        self.healthy_after = healthy_after
+
+        # spawn: shards start from a clean interpreter, not a fork of the
+        # bot process with its threads and sockets.
+        self.ctx = multiprocessing.get_context("spawn")
+        self.queue = self.ctx.Queue()
+        self.shards = {account: Shard(account) for account in accounts}
+        self.dedupe = UuidDeduper()
+        self.messages = 0
+        self._lock = threading.Lock()
+
+    # --- Lifecycle ---
+    def start(self):
+        for shard in self.shards.values():
+            self._spawn(shard)
+        threading.Thread(target=self._consume, name="shard-consumer", daemon=True).start()
+        threading.Thread(target=self._monitor, name="shard-monitor", daemon=True).start()
+        log.info("Started %d shard(s): %s", len(self.shards), ", ".join(self.shards))
+        return self
+
+    def stop(self):
+        with self._lock:
+            for shard in self.shards.values():
+                if shard.process is not None and shard.process.is_alive():
+                    shard.process.terminate()
+            for shard in self.shards.values():
+                if shard.process is not None:
+                    shard.process.join(5)
+
+    def _spawn(self, shard):
+        process = self.ctx.Process(
+            target=self.target,
+            args=(shard.account, self.queue),
+            name=f"shard-{shard.account}",
+            daemon=True
+        )
+        process.start()
+        shard.process = process
+        shard.started_at = time.monotonic()
+        shard.last_heartbeat = shard.started_at
+        shard.connected = False
+
+    # --- Messages ---
+    def _consume(self):
+        while True:
+            try:
+                message = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            kind, account = message[0], message[1]
+            if kind == "heartbeat":
+                shard = self.shards.get(account)
+                if shard is not None:
+                    shard.last_heartbeat = time.monotonic()
+                    shard.connected = message[3]
+                continue
+            self.messages += 1
+            if not self.dedupe.first_time((kind, message[2])):
+                continue
+            try:
+                self.on_message(message)
+            except Exception as e:
+                log.exception("Shard message error: %s", e)
+
+    # --- Health ---
+    def _monitor(self):
+        while True:
+            time.sleep(self.check_interval)
+            with self._lock:
+                for shard in self.shards.values():
+                    self._check(shard)
+
+    def _check(self, shard):
+        now = time.monotonic()
+        process = shard.process
+        if process is not None and process.is_alive():
+            if now - shard.last_heartbeat <= self.health_timeout:
+                if now - shard.started_at >= self.healthy_after:
+                    shard.failures = 0
+                return
+            log.warning("Shard %s sent no heartbeat for %.0fs, restarting.", shard.account, now - shard.last_heartbeat)
+            process.kill()
+            process.join(5)
+        elif process is not None:
+            log.warning("Shard %s exited (code %s).", shard.account, process.exitcode)
+
+        if shard.process is not None:
+            shard.process = None
+            delay = min(self.restart_delay_max, self.restart_delay_min * (2 ** shard.failures))
+            shard.failures += 1
+            shard.next_start = now + delay * random.uniform(0.5, 1.0)
+        if now >= shard.next_start:
+            shard.restarts += 1
+            log.info("Restarting shard %s (restart %d).", shard.account, shard.restarts)
+            self._spawn(shard)
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            "messages": self.messages,
+            "duplicates_suppressed": self.dedupe.suppressed,
+            "dedupe_entries": len(self.dedupe),
+            "shards": {
+                shard.account: {
+                    "alive": bool(shard.process is not None and shard.process.is_alive()),
+                    "connected": shard.connected,
+                    "restarts": shard.restarts,
+                    "heartbeat_age": round(now - shard.last_heartbeat, 1) if shard.last_heartbeat else None,
+                }
+                for shard in self.shards.values()
+            },
+        }
@@ -0,0 +1,152 @@
+from call_state import CallStateStore, NEW, UP, UPDATED, ENDED, STALE, EVICTED
+from frame_codec import extract_frame, extract_rows
+from replay import synthetic_frames
+
+
+def call(uuid, status="ringing", duration="0", did="100", termination="X MOBILE 1"):
+    return {"uuid": uuid, "status": status, "duration": duration, "cid_num": did, "termination": termination}
+
+
+def apply(state, calls=(), end=(), as_dict_page=False):
+    page = {str(i): c for i, c in enumerate(calls)} if as_dict_page else list(calls)
+    return [(t.kind, t.uuid) for t in state.apply_frame([page], list(end))]
+
+
+def test_new_ringing_call_is_only_new():
+    state = CallStateStore()
+    assert apply(state, [call("a")]) == [(NEW, "a")]
+    assert not state.get("a").detected
+
+
+def test_call_already_up_is_detected_on_first_sight():
+    state = CallStateStore()
+    assert apply(state, [call("a", "up", "3")]) == [(NEW, "a"), (UP, "a")]
+    assert state.get("a").duration == 3
+    assert state.stats()["detected"] == 1
+
+
+def test_ringing_to_up_is_up_not_updated_and_refreshes_number():
+    state = CallStateStore()
+    apply(state, [call("a", did="", termination="UNKNOWN")])
+    assert apply(state, [call("a", "up", did="555", termination="EGYPT MOBILE 2010")]) == [(UP, "a")]
+    record = state.get("a")
+    assert (record.did, record.termination, record.detected) == ("555", "EGYPT MOBILE 2010", True)
+
+
+def test_duration_tick_is_updated_and_unchanged_frame_is_silent():
+    state = CallStateStore()
+    apply(state, [call("a", "up", "1")])
+    assert apply(state, [call("a", "up", "2")]) == [(UPDATED, "a")]
+    assert state.get("a").duration == 2
+    assert apply(state, [call("a", "up", "2")]) == []
+
+
+def test_status_change_without_detection_is_updated():
+    state = CallStateStore()
+    apply(state, [call("a", "up")])
+    assert apply(state, [call("a", "hangup")]) == [(UPDATED, "a")]
+
+
+def test_ended_call_takes_the_end_duration():
+    state = CallStateStore()
+    apply(state, [call("a", "up", "4")])
+    transitions = state.apply_frame([[]], [{"uuid": "a", "duration": "9"}])
+    assert [(t.kind, t.uuid) for t in transitions] == [(ENDED, "a")]
+    assert transitions[0].record.duration == 9
+    assert "a" not in state
+    assert state.stats()["detected"] == 0
+
+
+def test_ended_without_duration_keeps_last_one():
+    state = CallStateStore()
+    apply(state, [call("a", "up", "4")])
+    transitions = state.apply_frame([[]], [{"uuid": "a"}])
+    assert transitions[0].record.duration == 4
+
+
+def test_end_for_unknown_call_is_ignored():
+    state = CallStateStore()
+    assert apply(state, [], [{"uuid": "nope", "duration": "1"}]) == []
+
+
+def test_call_missing_from_page_without_end_is_stale():
+    state = CallStateStore()
+    apply(state, [call("a"), call("b")])
+    assert apply(state, [call("a")]) == [(STALE, "b")]
+    assert len(state) == 1
+
+
+def test_ended_and_listed_in_same_frame_is_not_also_stale():
+    state = CallStateStore()
+    apply(state, [call("a", "up"), call("b", "up")])
+    assert apply(state, [call("a", "up")], [{"uuid": "a"}]) == [(ENDED, "a"), (STALE, "b")]
+    assert len(state) == 0
+
+
+def test_duplicate_uuid_within_one_frame():
+    state = CallStateStore()
+    assert apply(state, [call("a", "up", "1"), call("a", "up", "2"), call("b")]) == \
+        [(NEW, "a"), (UP, "a"), (UPDATED, "a"), (NEW, "b")]
+    # Seen twice but counted once: the next frames don't mark anything stale.
+    assert apply(state, [call("a", "up", "2"), call("a", "up", "2"), call("b")]) == []
+    assert apply(state, [call("b"), call("a", "up", "2"), call("b")]) == []
+    assert apply(state, [call("a", "up", "2")]) == [(STALE, "b")]
+
+
+def test_dict_and_list_pages_are_equivalent():
+    calls = [call("a", "up", "1"), call("b")]
+    assert apply(CallStateStore(), calls) == apply(CallStateStore(), calls, as_dict_page=True)
+
+
+def test_missing_fields_use_defaults_and_missing_uuid_is_skipped():
+    state = CallStateStore()
+    assert apply(state, [{"uuid": "a", "status": "up"}, {"status": "up"}, {"uuid": ""}]) == \
+        [(NEW, "a"), (UP, "a")]
+    record = state.get("a")
+    assert (record.did, record.termination, record.duration) == ("Unknown", "UNKNOWN", 0)
+
+
+def test_records_older_than_ttl_are_evicted():
+    # A safety net: normal frames either refresh a record or stale-sweep
+    # it, so age one by hand (and keep it out of this frame's stale sweep).
+    now = [0.0]
+    state = CallStateStore(ttl=100, clock=lambda: now[0])
+    apply(state, [call("a"), call("b")])
+    now[0] = 101.0
+    aged = state.records["a"]
+    aged.seen_at = 0.0
+    aged.last_seen = state.generation + 1
+
+    assert apply(state, [call("b")]) == [(EVICTED, "a")]
+    assert state.stats()["expired"] == 1
+
+
+def test_size_cap_evicts_least_recently_seen():
+    state = CallStateStore(max_records=2)
+    transitions = apply(state, [call("a"), call("b"), call("c")])
+    assert (EVICTED, "a") in transitions
+    assert len(state) == 2
+    assert state.stats()["evicted"] == 1
+
+
+def test_rows_path_matches_the_dict_walk():
+    from bench_frames import DictWalkStore
+
+    frames = [frame for _, frame in synthetic_frames(calls=300, concurrency=40, pages=3)]
+    frames.append({"calls": {"calls": [[{"status": "up"}], {"0": call("x", "up")}],
+                             "end": [{"uuid": "x"}, {}]}})
+    rows_state, dict_state = CallStateStore(), DictWalkStore()
+    for frame in frames:
+        rows, ended = extract_frame(frame)
+        via_rows = [(t.kind, t.uuid, t.record.did, t.record.duration) for t in rows_state.apply_rows(rows, ended)]
+        calls_data = frame["calls"]
+        via_dicts = [(t.kind, t.uuid, t.record.did, t.record.duration)
+                     for t in dict_state.apply_dicts(calls_data["calls"], calls_data["end"])]
+        assert via_rows == via_dicts
+
+
+def test_extract_rows_falls_back_when_a_field_is_missing():
+    assert extract_rows([[call("a"), {"uuid": "b"}]]) == [
+        ("a", "ringing", "0", "100", "X MOBILE 1"),
+        ("b", None, "0", "Unknown", "UNKNOWN"),
+    ]
@@ -0,0 +1,116 @@
+import time
+import asyncio
+import threading
+
+from delivery import DeliveryScheduler, PRIORITY_MESSAGE, PRIORITY_AUDIO
+
+
+class Ok:
+    ok = True
+    status_code = 200
+
+
+def blocked_send(gate):
+    def send():
+        gate.wait(5)
+        return Ok()
+    return send
+
+
+def test_full_audio_lane_does_not_drop_messages():
+    gate = threading.Event()
+    scheduler = DeliveryScheduler(rate_per_minute=60000, burst=100, workers=2,
+                                  max_queue=10, max_audio_queue=2)
+    for i in range(2):
+        assert scheduler.submit_audio(f"audio {i}", blocked_send(gate))
+
+    results = []
+    for i in range(5):
+        scheduler.submit_message(f"msg {i}", Ok, on_result=results.append)
+    deadline = time.monotonic() + 5
+    while len(results) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    gate.set()
+
+    assert results == [True] * 5
+    assert scheduler.dropped[0] == 0
+
+
+def test_full_audio_lane_blocks_submitter_until_room():
+    gate = threading.Event()
+    scheduler = DeliveryScheduler(rate_per_minute=60000, burst=100, workers=2, max_audio_queue=1)
+    assert scheduler.submit_audio("first", blocked_send(gate))
+
+    assert not scheduler.wait_for_audio_room(timeout=0.05)
+    assert not scheduler.submit_audio("timed out", Ok, timeout=0.05)
+
+    accepted = []
+    waiter = threading.Thread(target=lambda: accepted.append(scheduler.submit_audio("second", Ok)))
+    waiter.start()
+    time.sleep(0.1)
+    assert not accepted                      # still waiting for room
+    gate.set()
+    waiter.join(5)
+
+    assert accepted == [True]
+    assert scheduler.stats()["audio_waits"] >= 1
+
+
+def test_full_message_lane_drops_without_waiting():
+    gate = threading.Event()
+    scheduler = DeliveryScheduler(rate_per_minute=60000, burst=100, workers=2, max_queue=1)
+    assert scheduler.submit_message("first", blocked_send(gate))
+    results = []
+    started = time.monotonic()
+    assert not scheduler.submit_message("second", Ok, on_result=results.append)
+    assert time.monotonic() - started < 0.5
+    assert results == [False]
+    gate.set()
+
+
+def test_async_path_honours_retry_after():
+    scheduler = DeliveryScheduler(rate_per_minute=60000, burst=100, backoff_base=0.01)
+    replies = [(429, '{"ok": false, "parameters": {"retry_after": 0.05}}'), (200, '{"ok": true}')]
+
+    async def send():
+        return replies.pop(0)
+
+    started = time.monotonic()
+    assert asyncio.run(scheduler.deliver_async(PRIORITY_MESSAGE, "msg", send))
+    assert time.monotonic() - started >= 0.05
+    assert scheduler.rate_limited == 1
+    assert scheduler.delivered[PRIORITY_MESSAGE] == 1
+    assert scheduler.pending[PRIORITY_MESSAGE] == 0
+
+
+def test_async_path_gives_up_on_rejection():
+    scheduler = DeliveryScheduler(rate_per_minute=60000, burst=100)
+
+    async def send():
+        return 400, '{"ok": false, "description": "Bad Request"}'
+
+    assert not asyncio.run(scheduler.deliver_async(PRIORITY_AUDIO, "audio", send))
+    assert scheduler.dropped[PRIORITY_AUDIO] == 1
+    assert scheduler.retries == 0
+
+
+def test_async_path_sends_messages_before_audio():
+    # One token per 50 ms: a waiting message takes the next token before audio.
+    scheduler = DeliveryScheduler(rate_per_minute=1200, burst=1)
+    order = []
+
+    def sender(name):
+        async def send():
+            order.append(name)
+            return 200, "{}"
+        return send
+
+    async def main():
+        await scheduler.deliver_async(PRIORITY_MESSAGE, "first", sender("first"))
+        await asyncio.gather(
+            scheduler.deliver_async(PRIORITY_AUDIO, "audio", sender("audio")),
+            scheduler.deliver_async(PRIORITY_MESSAGE, "message", sender("message")),
+        )
+
+    asyncio.run(main())
+    assert order == ["first", "message", "audio"]
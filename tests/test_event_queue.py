@@ -0,0 +1,87 @@
+from call_state import CallStateStore, NEW, UP, ENDED
+from event_queue import CallEventQueue, coalesce_frames
+
+
+def frame(calls=(), end=()):
+    return {"calls": {"calls": [list(calls)], "end": list(end)}}
+
+
+def call(uuid, status="up", duration="1"):
+    return {"uuid": uuid, "status": status, "duration": duration, "cid_num": "100", "termination": "X"}
+
+
+def uuids_on_page(merged):
+    return [c["uuid"] for page in merged["calls"]["calls"]
+            for c in (page.values() if isinstance(page, dict) else page)]
+
+
+def test_single_frame_is_returned_as_is():
+    f = frame([call("a")])
+    assert coalesce_frames([f]) is f
+
+
+def test_latest_snapshot_wins_and_every_end_is_kept():
+    merged = coalesce_frames([
+        frame([call("a", duration="1"), call("b")], end=[{"uuid": "x"}]),
+        frame([call("a", duration="2")], end=[{"uuid": "b", "duration": "5"}]),
+    ])
+    assert uuids_on_page(merged) == ["a", "b"]          # b ended: salvaged from the older snapshot
+    assert merged["calls"]["calls"][0] == [call("a", duration="2")]
+    assert [e["uuid"] for e in merged["calls"]["end"]] == ["x", "b"]
+
+
+def test_call_that_ended_inside_the_batch_is_salvaged():
+    older = frame([call("short", duration="3"), call("stays")])
+    latest = frame([call("stays")], end=[{"uuid": "short", "duration": "4"}])
+    merged = coalesce_frames([older, latest])
+    assert uuids_on_page(merged) == ["stays", "short"]
+
+    # Applied as one frame, the call is still detected and then ended.
+    transitions = [(t.kind, t.uuid) for t in CallStateStore().apply_frame(
+        merged["calls"]["calls"], merged["calls"]["end"])]
+    assert (UP, "short") in transitions and (ENDED, "short") in transitions
+
+
+def test_vanished_call_without_end_is_not_salvaged():
+    merged = coalesce_frames([frame([call("gone"), call("a")]), frame([call("a")])])
+    assert uuids_on_page(merged) == ["a"]
+
+
+def test_ended_call_still_on_latest_page_is_not_duplicated():
+    merged = coalesce_frames([frame([call("a")]), frame([call("a")], end=[{"uuid": "a"}])])
+    assert uuids_on_page(merged) == ["a"]
+
+
+def test_duplicate_uuids_across_frames_are_salvaged_once():
+    merged = coalesce_frames([
+        frame([call("a", duration="1")]),
+        frame([call("a", duration="2")]),
+        frame([], end=[{"uuid": "a"}, {"uuid": "a", "duration": "3"}]),
+    ])
+    assert merged["calls"]["calls"][-1] == [call("a", duration="2")]
+    assert merged["calls"]["end"] == [{"uuid": "a", "duration": "3"}]
+
+
+def test_dict_pages_and_missing_sections_are_tolerated():
+    older = {"calls": {"calls": [{"0": call("a")}]}}
+    latest = {"calls": {"end": [{"uuid": "a"}]}}
+    merged = coalesce_frames([older, None, latest])
+    assert uuids_on_page(merged) == ["a"]
+
+
+def test_full_queue_merges_oldest_frames_instead_of_dropping():
+    applied = []
+    queue = CallEventQueue(applied.append, maxsize=2)
+    queue.put(frame([call("a")], end=[{"uuid": "x"}]))
+    queue.put(frame([call("a")]))
+    queue.put(frame([call("a")], end=[{"uuid": "y"}]))
+    assert queue.depth == 2
+    assert queue.stats()["overflow_merges"] == 1
+
+    queue.start()
+    queue.stop()
+    assert len(applied) == 1
+    assert [e["uuid"] for e in applied[0]["calls"]["end"]] == ["x", "y"]
+    state = CallStateStore()
+    assert [(t.kind, t.uuid) for t in state.apply_frame(applied[0]["calls"]["calls"], [])] == \
+        [(NEW, "a"), (UP, "a")]
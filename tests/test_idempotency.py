@@ -0,0 +1,53 @@
+from idempotency import DeliveredIndex
+
+
+def deliver(index, uuid, did, digest, audio=True):
+    claim = index.claim(uuid, did)
+    assert claim is not None
+    duplicate = claim.duplicate_content(digest, audio=audio)
+    claim.on_result(True)
+    return duplicate
+
+
+def test_same_call_is_claimed_once(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"))
+    claim = index.claim("u1", "100")
+    assert index.claim("u1", "100") is None          # in flight
+    claim.duplicate_content("h1")
+    claim.on_result(True)
+    assert index.claim("u1", "100") is None          # delivered
+    assert index.stats()["suppressed_calls"] == 2
+
+
+def test_failed_call_can_be_claimed_again(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"))
+    index.claim("u1", "100").abandon()
+    assert index.claim("u1", "100") is not None
+
+
+def test_identical_bytes_for_other_numbers_are_delivered(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"))
+    assert not deliver(index, "u1", "100", "silence")
+    assert not deliver(index, "u2", "200", "silence")
+    assert index.stats()["suppressed_content"] == 0
+
+
+def test_identical_bytes_for_same_number_within_window_are_skipped(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"))
+    assert not deliver(index, "u1", "100", "h1")
+    assert deliver(index, "u2", "100", "h1")
+    assert index.stats()["suppressed_content"] == 1
+
+
+def test_content_match_expires_after_window(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"), content_window=-1)
+    assert not deliver(index, "u1", "100", "h1")
+    assert not deliver(index, "u2", "100", "h1")
+
+
+def test_non_audio_body_is_never_matched_or_recorded(tmp_path):
+    index = DeliveredIndex(str(tmp_path / "d.db"))
+    assert not deliver(index, "u1", "100", "login-page", audio=False)
+    assert not deliver(index, "u2", "100", "login-page", audio=False)
+    assert index.stats()["entries"] == 0
+    assert index.claim("u1", "100") is not None      # may be fetched again
@@ -0,0 +1,107 @@
+import time
+import sqlite3
+import threading
+
+from job_store import DownloadJobQueue, SCHEMA, RUNNING
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+def make_queue(tmp_path, monkeypatch, process, **kwargs):
+    monkeypatch.chdir(tmp_path)
+    jobs = DownloadJobQueue(str(tmp_path / "jobs.db"), process, workers=2,
+                            flush_interval=0.01, retry_delay=0, **kwargs)
+    jobs.start()
+    return jobs
+
+
+def test_dropped_upload_is_retried_once_per_attempt(tmp_path, monkeypatch):
+    attempts = []
+    lock = threading.Lock()
+
+    def process(job, on_uploaded):
+        with lock:
+            attempts.append(job.attempts)
+        on_uploaded(False)   # delivery queue full: dropped synchronously
+        return False
+
+    jobs = make_queue(tmp_path, monkeypatch, process, max_attempts=3)
+    jobs.enqueue("u1", "123", "X", "5", "http://x")
+    wait_until(lambda: jobs.failed)
+    time.sleep(0.1)
+
+    assert attempts == [1, 2, 3]
+    assert jobs.failed == 1
+    assert jobs.retried == 2
+
+
+def test_download_failure_is_retried(tmp_path, monkeypatch):
+    attempts = []
+
+    def process(job, on_uploaded):
+        attempts.append(job.attempts)
+        return False
+
+    jobs = make_queue(tmp_path, monkeypatch, process, max_attempts=2)
+    jobs.enqueue("u1", "123", "X", "5", "http://x")
+    wait_until(lambda: jobs.failed)
+    time.sleep(0.1)
+
+    assert attempts == [1, 2]
+    assert jobs.failed == 1
+
+
+def test_upload_delivered_completes_job(tmp_path, monkeypatch):
+    def process(job, on_uploaded):
+        threading.Timer(0.01, on_uploaded, args=(True,)).start()
+        return True
+
+    jobs = make_queue(tmp_path, monkeypatch, process)
+    jobs.enqueue("u1", "123", "X", "5", "http://x")
+    jobs.enqueue("u1", "123", "X", "5", "http://x")
+    wait_until(lambda: jobs.completed)
+    time.sleep(0.1)
+
+    assert jobs.completed == 1
+    assert jobs.duplicates == 1
+    assert jobs.failed == 0
+
+
+def test_resumed_job_waits_for_ready_without_using_attempts(tmp_path, monkeypatch):
+    # A job left running by a crashed process, resumed before any download
+    # client exists (e.g. creds.json not written yet).
+    db = tmp_path / "jobs.db"
+    conn = sqlite3.connect(str(db))
+    conn.executescript(SCHEMA)
+    conn.execute(
+        "INSERT INTO jobs (uuid, did, url, state, attempts, created, updated) VALUES (?, ?, ?, ?, 0, 0, 0)",
+        ("u1", "123", "http://x", RUNNING)
+    )
+    conn.commit()
+    conn.close()
+
+    client_ready = threading.Event()
+    attempts = []
+
+    def process(job, on_uploaded):
+        attempts.append(job.attempts)
+        on_uploaded(True)
+        return True
+
+    jobs = make_queue(tmp_path, monkeypatch, process, max_attempts=3,
+                      ready=lambda job: client_ready.is_set(), defer_delay=0.01)
+    assert jobs.resumed == 1
+    wait_until(lambda: jobs.deferred >= 5)
+    assert attempts == []
+
+    client_ready.set()
+    wait_until(lambda: jobs.completed)
+    assert attempts == [1]
+    assert jobs.failed == 0
+    assert jobs.retried == 0
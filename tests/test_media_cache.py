@@ -0,0 +1,25 @@
+import media_cache
+from media_cache import MediaCache
+
+
+def test_asset_is_read_once(tmp_path):
+    path = tmp_path / "thumb.png"
+    path.write_bytes(b"png")
+    cache = MediaCache()
+
+    assert cache.asset_bytes(str(path)) == b"png"
+    path.write_bytes(b"changed")
+    assert cache.asset_bytes(str(path)) == b"png"
+    assert cache.stats() == {"hits": 1, "reads": 1, "assets_in_memory": 1}
+
+
+def test_missing_asset_is_rechecked_later(tmp_path):
+    now = [0.0]
+    path = tmp_path / "thumb.png"
+    cache = MediaCache(clock=lambda: now[0])
+
+    assert cache.asset_bytes(str(path)) is None
+    path.write_bytes(b"png")
+    assert cache.asset_bytes(str(path)) is None          # within the recheck window
+    now[0] += media_cache.MISSING_RECHECK_SECONDS
+    assert cache.asset_bytes(str(path)) == b"png"
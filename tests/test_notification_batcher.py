@@ -0,0 +1,74 @@
+import time
+
+from notification_batcher import NotificationBatcher
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+class ManualSend:
+    """Records sends; each stays "queued" until finish() reports it."""
+
+    def __init__(self):
+        self.texts = []
+        self.callbacks = []
+
+    def __call__(self, text, on_result):
+        self.texts.append(text)
+        self.callbacks.append(on_result)
+
+    def finish(self, delivered=True):
+        self.callbacks.pop(0)(delivered)
+
+
+def make_batcher(send, window_ms=20):
+    return NotificationBatcher(window_ms, send, lambda item: item[2],
+                               lambda items: [",".join(item[2] for item in items)])
+
+
+def test_first_detection_is_sent_at_once():
+    send = ManualSend()
+    batcher = make_batcher(send)
+    batcher.add("X", "f", "1")
+    assert send.texts == ["1"]
+
+
+def test_batch_waits_for_previous_message_and_keeps_merging():
+    send = ManualSend()
+    batcher = make_batcher(send)
+    batcher.add("X", "f", "1")
+    batcher.add("X", "f", "2")
+    batcher.add("X", "f", "3")
+    wait_until(lambda: batcher.held)   # window closed, "1" still unsent
+    batcher.add("X", "f", "4")
+    assert send.texts == ["1"]
+
+    send.finish()
+    wait_until(lambda: len(send.texts) == 2)
+    assert send.texts[1] == "2,3,4"
+    assert batcher.stats()["pending"] == 0
+
+
+def test_dropped_message_releases_the_batch():
+    send = ManualSend()
+    batcher = make_batcher(send)
+    batcher.add("X", "f", "1")
+    batcher.add("X", "f", "2")
+    send.finish(delivered=False)
+    wait_until(lambda: len(send.texts) == 2)
+    assert send.texts[1] == "2"
+
+
+def test_quiet_window_closes():
+    send = ManualSend()
+    batcher = make_batcher(send)
+    batcher.add("X", "f", "1")
+    send.finish()
+    time.sleep(0.05)
+    batcher.add("X", "f", "2")
+    assert send.texts == ["1", "2"]
@@ -0,0 +1,86 @@
+import shutil
+import threading
+import subprocess
+
+# ==========================================================
+# === OPTIONAL WAV -> MP3 TRANSCODING (ffmpeg)
+# ==========================================================
+# Some recordings are served as uncompressed WAV, which makes uploads
+# slow and can hit Telegram's file size limit. When enabled, a WAV is
+# re-encoded to MP3 at a fixed bitrate before sendAudio; anything else
+# (already mp3/ogg/...) is passed through untouched. The encoder is an
+# ffmpeg child process, so the calling worker thread only waits on a
+# pipe (the GIL is released); `workers` caps how many encodes run at once.
+
+WAV_MAGIC = (b"RIFF", b"WAVE")
+
+
+def is_wav(head):
+    """True for a RIFF/WAVE header (first 12 bytes of the file)."""
+    return len(head) >= 12 and head[:4] == WAV_MAGIC[0] and head[8:12] == WAV_MAGIC[1]
+
+
+class Transcoder:
+    def __init__(self, bitrate="48k", workers=2, ffmpeg=None, timeout=120):
+        self.bitrate = bitrate
+        self.timeout = timeout
+        self.ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+
+        self.transcoded = 0
+        self.passed_through = 0
+        self.failed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.seconds = 0.0
+
+    @property
+    def available(self):
+        return self.ffmpeg is not None
+
+    def wants(self, f):
+        """Peeks at an open audio file: only WAVs are transcoded."""
+        head = f.read(12)
+        f.seek(0)
+        if is_wav(head):
+            return True
+        with self._lock:
+            self.passed_through += 1
+        return False
+
+    def transcode(self, f):
+        """Returns the MP3 bytes for the WAV in `f`. Raises on encoder errors."""
+        data = f.read()
+        f.seek(0)
+        cmd = [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error",
+            "-f", "wav", "-i", "pipe:0",
+            "-vn", "-codec:a", "libmp3lame", "-b:a", self.bitrate,
+            "-f", "mp3", "pipe:1",
+        ]
+        with self._slots:
+            proc = subprocess.run(cmd, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  timeout=self.timeout)
+        if proc.returncode != 0 or not proc.stdout:
+            with self._lock:
+                self.failed += 1
+            raise RuntimeError(f"ffmpeg exited {proc.returncode}: {proc.stderr.decode(errors='replace')[:200]}")
+        return proc.stdout
+
+    def record(self, size_in, size_out, seconds):
+        with self._lock:
+            self.transcoded += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+            self.seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "transcoded": self.transcoded,
+                "passed_through": self.passed_through,
+                "failed": self.failed,
+                "bytes_saved": self.bytes_in - self.bytes_out,
+                "added_seconds_avg": round(self.seconds / self.transcoded, 3) if self.transcoded else 0,
+            }